@@ -0,0 +1,54 @@
+# 对比 draw_bg 的旧实现（逐块 BuildImage.paste）与现在的缓存实现
+# 用法：python benchmarks/bench_bg.py
+
+import timeit
+
+import bootstrap  # noqa: F401
+import nonebot
+
+nonebot.init()
+nonebot.load_plugin("nonebot_plugin_picmcstat")
+
+from pil_utils import BuildImage  # noqa: E402
+
+from nonebot_plugin_picmcstat.draw import bg_cache, draw_bg  # noqa: E402
+from nonebot_plugin_picmcstat.res import get_dirt_res, get_grass_res  # noqa: E402
+
+SIZES = [(512, 294), (684, 539), (1200, 2400)]
+
+
+def legacy_draw_bg(width: int, height: int) -> BuildImage:
+    grass, dirt = get_grass_res(), get_dirt_res()
+    size = dirt.width
+    bg = BuildImage.new("RGBA", (width, height))
+    for hi in range(0, height, size):
+        for wi in range(0, width, size):
+            bg.paste(dirt if hi else grass, (wi, hi))
+    return bg
+
+
+def main():
+    print(f"{'size':>12} {'legacy':>10} {'cold':>10} {'cached':>10}")
+    for w, h in SIZES:
+        assert legacy_draw_bg(w, h).image.tobytes() == draw_bg(w, h).image.tobytes()
+
+        number = 1 if w * h > 1_000_000 else 10
+        legacy = (
+            timeit.timeit(lambda w=w, h=h: legacy_draw_bg(w, h), number=number) / number
+        )
+
+        def cold(w=w, h=h):
+            bg_cache.clear()
+            draw_bg(w, h)
+
+        cold_t = timeit.timeit(cold, number=number) / number
+        draw_bg(w, h)
+        cached = timeit.timeit(lambda w=w, h=h: draw_bg(w, h), number=number) / number
+        print(
+            f"{f'{w}x{h}':>12} {legacy * 1000:>8.2f}ms {cold_t * 1000:>8.2f}ms"
+            f" {cached * 1000:>8.2f}ms",
+        )
+
+
+if __name__ == "__main__":
+    main()
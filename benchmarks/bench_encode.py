@@ -0,0 +1,114 @@
+# 对比各输出格式的编码耗时与图片大小，以及 MOTD 含有乱码（§k）时动图的编码耗时
+# 用法：python benchmarks/bench_encode.py [max_bytes]
+
+import sys
+import timeit
+
+import bootstrap  # noqa: F401
+import nonebot
+
+nonebot.init()
+nonebot.load_plugin("nonebot_plugin_picmcstat")
+
+from mcstatus.responses import JavaStatusResponse  # noqa: E402
+
+from nonebot_plugin_picmcstat import draw  # noqa: E402
+from nonebot_plugin_picmcstat.config import config  # noqa: E402
+from nonebot_plugin_picmcstat.encode import (  # noqa: E402
+    encode_animation,
+    encode_image,
+)
+
+CASES = [
+    ("jpeg", {}),
+    ("jpeg", {"quality": 90}),
+    ("png", {}),
+    ("png", {"png_colors": 256}),
+    ("png", {"png_colors": 64}),
+    ("webp", {}),
+    ("webp", {"quality": 90}),
+]
+
+
+ANIMATION_CASES = ["gif", "webp"]
+
+
+def make_response(description: str) -> JavaStatusResponse:
+    raw = {
+        "version": {"name": "Paper 1.21.4", "protocol": 772},
+        "players": {
+            "online": 12,
+            "max": 100,
+            "sample": [
+                {"name": f"§{'abcde'[i % 5]}Player{i}", "id": "0" * 32}
+                for i in range(12)
+            ],
+        },
+        "description": description,
+        "enforcesSecureChat": True,
+    }
+    return JavaStatusResponse.build(raw, latency=23.4)  # type: ignore
+
+
+def make_canvas():
+    res = make_response(
+        "§6§lA Minecraft Server §r§7- §bwelcome\n§aSurvival §7| §dMinigames",
+    )
+
+    # 截获 build_img 的画布，只测编码
+    canvases = []
+    orig = draw.encode_image
+    draw.encode_image = lambda img, *_, **__: canvases.append(img) or orig(img)
+    try:
+        draw.draw_java(res, "example.com")
+    finally:
+        draw.encode_image = orig
+    return canvases[0]
+
+
+def make_animation():
+    res = make_response("§6§lA Minecraft Server §r§k||||§r §bwelcome\n§aSurvival")
+
+    # 截获 build_img 画好的各帧，只测编码
+    frames = []
+    orig = draw.draw_animation_frames
+    draw.draw_animation_frames = lambda *a: frames.append(orig(*a)) or frames[-1]
+    config.animate_obfuscated = True
+    try:
+        draw.draw_java(res, "example.com")
+    finally:
+        draw.draw_animation_frames = orig
+        config.animate_obfuscated = False
+    return frames[0]
+
+
+def main():
+    max_bytes = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    canvas = make_canvas()
+    print(f"canvas: {canvas.width}x{canvas.height}, max_bytes: {max_bytes or '-'}")
+    print(f"{'format':>8} {'params':>20} {'size':>10} {'time':>10}")
+    for fmt, params in CASES:
+        kw = {"fmt": fmt, "max_bytes": max_bytes, **params}
+        size = len(encode_image(canvas, **kw).getbuffer())
+        number = 10
+        t = timeit.timeit(lambda kw=kw: encode_image(canvas, **kw), number=number)
+        print(f"{fmt:>8} {params or ''!s:>20} {size:>9}B {t / number * 1000:>8.2f}ms")
+
+    first, patches, offset = make_animation()
+    print(
+        f"animation: {first.width}x{first.height}, {len(patches) + 1} frames,"
+        f" patch {patches[0].width}x{patches[0].height}",
+    )
+    for fmt in ANIMATION_CASES:
+        kw = {"fmt": fmt, "max_bytes": max_bytes}
+        size = len(encode_animation(first, patches, offset, **kw).getbuffer())
+        number = 10
+        t = timeit.timeit(
+            lambda kw=kw: encode_animation(first, patches, offset, **kw),
+            number=number,
+        )
+        print(f"{fmt:>8} {'animated':>20} {size:>9}B {t / number * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
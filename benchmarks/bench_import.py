@@ -0,0 +1,66 @@
+# 测量加载插件的耗时，并检查加载时没有导入渲染与查询相关的重量级模块
+# 每次都在新的子进程中测量，前置插件（alconna）的加载时间不计入
+# 用法：python benchmarks/bench_import.py [-n 次数] [--max-ms 上限]
+# 超出上限或导入了不该导入的模块时以退出码 1 结束
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# 这些模块应该在第一次查询（或后台预热）时才导入
+LAZY_MODULES = ["mcstatus", "PIL", "pil_utils", "skia", "dns.resolver", "asyncio_dgram"]
+
+MEASURE_SCRIPT = f"""
+import json, sys, time
+import nonebot
+nonebot.init(log_level="WARNING")
+nonebot.load_plugin("nonebot_plugin_alconna")
+preloaded = set(sys.modules)
+start = time.perf_counter()
+nonebot.load_plugin("nonebot_plugin_picmcstat")
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "eager": [
+        m for m in {LAZY_MODULES!r}
+        if m in sys.modules and m not in preloaded
+    ],
+}}))
+"""
+
+
+def measure() -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, help="加载耗时中位数的上限（毫秒）")
+    args = parser.parse_args()
+
+    results = [measure() for _ in range(args.number)]
+    times = [x["ms"] for x in results]
+    eager = sorted({m for x in results for m in x["eager"]})
+    median = statistics.median(times)
+    print(f"load_plugin: min {min(times):.1f}ms / median {median:.1f}ms")
+    print(f"eagerly imported: {', '.join(eager) or '-'}")
+
+    failed = bool(eager)
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"median load time exceeds {args.max_ms}ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
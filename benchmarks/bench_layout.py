@@ -0,0 +1,120 @@
+# 测量 ImageGrid / ImageLine / ImageColumns 的排版耗时随条目数的变化，检查是否线性增长
+# 每个条目都是排版好的文字，嵌套结构与玩家列表、Mod 列表相同：
+# 外层的 ImageGrid 每行右侧是一个 ImageGrid.from_list 或 ImageColumns
+# 用法：python benchmarks/bench_layout.py [--sizes 500 2000] [--draw] [--max-ratio 2]
+# 最大规模与最小规模的单条耗时之比超过 --max-ratio 时以退出码 1 结束，
+# 排版算出的尺寸装不下所有条目时也以退出码 1 结束
+
+import argparse
+import sys
+import time
+
+import bootstrap  # noqa: F401
+import nonebot
+
+nonebot.init(log_level="WARNING")
+nonebot.load_plugin("nonebot_plugin_picmcstat")
+
+from nonebot_plugin_picmcstat import draw  # noqa: E402
+
+ENTRIES_PER_LIST = 50
+
+
+def build_tree(entries: int, align_items: bool = False) -> draw.ImageGrid:
+    texts = [draw.ex_default_style(f"entry-{i:05d}") for i in range(entries)]
+    grid = draw.ImageGrid(align_items=align_items)
+    for i, start in enumerate(range(0, entries, ENTRIES_PER_LIST)):
+        chunk = texts[start : start + ENTRIES_PER_LIST]
+        if i % 2:
+            right = draw.ImageColumns(*(list(x) for x in draw.chunks(chunk, 10)))
+        else:
+            right = draw.ImageGrid.from_list(chunk)
+        grid.append_line(draw.ex_default_style(f"List {i}: ", "7"), right)
+    return grid
+
+
+def layout(grid: draw.ImageGrid) -> None:
+    draw.reset_layout(grid)
+    grid.size  # noqa: B018
+    for _ in grid.placements((0, 0)):
+        pass
+
+
+# 所有条目都要落在 size 之内，否则画图时会被裁掉
+def check_bounds(grid: draw.ImageGrid) -> bool:
+    draw.reset_layout(grid)
+    grid_width, grid_height = grid.size
+    right = bottom = 0.0
+    for it, (x, y) in grid.placements((0, 0)):
+        right = max(right, x + draw.width(it))
+        bottom = max(bottom, y + it.height)
+    fits = right <= grid_width + 1e-6 and bottom <= grid_height + 1e-6
+    if not fits:
+        print(
+            f"grid size {grid_width:.1f}x{grid_height:.1f} does not contain"
+            f" its placements ({right:.1f}x{bottom:.1f})",
+        )
+    return fits
+
+
+def bounds_cases() -> list[draw.ImageGrid]:
+    # 左侧最宽的行与右侧最宽的行不是同一行时，对齐后的宽度要同时算上两者
+    aligned = draw.ImageGrid()
+    aligned.append_line(draw.ex_default_style("a very long label: ", "7"), "1")
+    aligned.append_line(
+        draw.ex_default_style("x: ", "7"),
+        "a much longer value than the label above",
+    )
+    return [aligned, build_tree(200), build_tree(200, align_items=True)]
+
+
+def measure(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 4000])
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--draw", action="store_true", help="同时测量画到图片上的耗时")
+    parser.add_argument("--max-ratio", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # 每个用例都检查一遍，输出所有不通过的用例
+    bounds_results = [check_bounds(x) for x in bounds_cases()]
+    bounds_ok = all(bounds_results)
+
+    header = f"{'entries':>8} {'layout':>10} {'per entry':>10}"
+    if args.draw:
+        header += f" {'draw':>10} {'per entry':>10}"
+    print(header)
+
+    per_entry: list[float] = []
+    for entries in args.sizes:
+        grid = build_tree(entries)
+        layout_t = measure(lambda: layout(grid), args.repeat)  # noqa: B023
+        per_entry.append(layout_t / entries)
+        line = (
+            f"{entries:>8} {layout_t * 1000:>8.2f}ms {layout_t / entries * 1e6:>8.2f}us"
+        )
+        if args.draw:
+            draw_t = measure(grid.to_image, 1)
+            line += f" {draw_t * 1000:>8.2f}ms {draw_t / entries * 1e6:>8.2f}us"
+        print(line)
+
+    ratio = per_entry[-1] / per_entry[0]
+    print(f"per-entry layout time ratio (largest / smallest): {ratio:.2f}")
+    if ratio > args.max_ratio:
+        print(f"layout does not scale linearly (ratio > {args.max_ratio})")
+        sys.exit(1)
+    if not bounds_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
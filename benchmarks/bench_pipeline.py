@@ -0,0 +1,224 @@
+# MOTD 处理与渲染流程各阶段的基准测试，使用 fixtures.py 中的合成数据，不需要联网
+# 用法：
+#   python benchmarks/bench_pipeline.py                            # 只输出结果
+#   python benchmarks/bench_pipeline.py --save-baseline base.json  # 保存为基线
+#   python benchmarks/bench_pipeline.py --baseline base.json       # 与基线对比
+#   python benchmarks/bench_pipeline.py --cold -k forge  # 每次清空缓存，只跑 forge 相关
+# 与基线对比时，中位数变慢超过 --threshold 的项目会被标出，并以退出码 1 结束
+# py heap 一列是 tracemalloc 统计的 Python 堆内存峰值，
+# 占内存大头的 Pillow / skia 像素缓冲不计入，只适合对比 Python 对象的分配
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+import bootstrap  # noqa: F401
+import nonebot
+
+nonebot.init()
+nonebot.load_plugin("nonebot_plugin_picmcstat")
+
+from fixtures import bedrock_fixtures, java_fixtures  # noqa: E402
+
+from nonebot_plugin_picmcstat import draw  # noqa: E402
+from nonebot_plugin_picmcstat.util import (  # noqa: E402
+    BBCodeTransformer,
+    motd_bbcode_lines,
+    motd_cache,
+    motd_to_bbcode_lines,
+    split_motd_lines,
+    trim_motd,
+)
+
+MIN_SAMPLE_TIME = 0.02
+
+
+@dataclass
+class Result:
+    min_ms: float
+    median_ms: float
+    py_heap_peak_kib: float
+
+
+def clear_caches():
+    for cache in (
+        draw.text_cache,
+        draw.bg_cache,
+        draw.header_cache,
+        draw.icon_cache,
+        motd_cache,
+    ):
+        cache.clear()
+
+
+def capture_card(func: Callable[[], Any]) -> dict[str, Any]:
+    # 截获 build_img 的参数，用来单独测排版与合成
+    captured = {}
+    orig = draw.build_img
+
+    def fake_build_img(header1, header2, icon=None, extra=None):
+        captured.update(header1=header1, header2=header2, icon=icon, extra=extra)
+        return orig(header1, header2, icon, extra)
+
+    draw.build_img = fake_build_img
+    try:
+        func()
+    finally:
+        draw.build_img = orig
+    return captured
+
+
+def make_stages(res: Any, drawer: Callable[..., Any]) -> dict[str, Callable[[], Any]]:
+    transformer = BBCodeTransformer(bedrock=res.motd.bedrock)
+    trimmed = trim_motd(res.motd.parsed)
+    lines = split_motd_lines(trimmed)
+    card = capture_card(lambda: drawer(res, "example.com"))
+    grid: draw.ImageGrid = card["extra"]
+    bg_size = draw.build_canvas(**card).size
+
+    def layout():
+        # 排版结果会缓存在各个节点上，先清掉再测一次完整的排版
+        draw.reset_layout(grid)
+        return grid.size, list(grid.placements((0, 0)))
+
+    return {
+        "trim_motd": lambda: trim_motd(res.motd.parsed),
+        "split_motd_lines": lambda: split_motd_lines(trimmed),
+        "transform": lambda: [transformer.transform(x) for x in lines],
+        # 合并了 split_motd_lines 与 transform 的单次遍历，以及带缓存的版本
+        "motd_bbcode": lambda: motd_to_bbcode_lines(trimmed, res.motd.bedrock),
+        "motd_bbcode_cached": lambda: motd_bbcode_lines(res.motd),
+        "grid_layout": layout,
+        "draw_bg": lambda: draw.draw_bg(*bg_size),
+        "build_img": lambda: draw.build_img(**card),
+        drawer.__name__: lambda: drawer(res, "example.com"),
+    }
+
+
+def collect() -> dict[str, Callable[[], Any]]:
+    benches = {}
+    for name, res in java_fixtures().items():
+        for stage, func in make_stages(res, draw.draw_java).items():
+            benches[f"java/{name}/{stage}"] = func
+    for name, res in bedrock_fixtures().items():
+        for stage, func in make_stages(res, draw.draw_bedrock).items():
+            benches[f"bedrock/{name}/{stage}"] = func
+    return benches
+
+
+def measure(func: Callable[[], Any], repeat: int, cold: bool) -> Result:
+    def once() -> float:
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    # 先跑一次预热，并决定每个样本要跑几次
+    first = once()
+    number = 1 if cold else max(1, int(MIN_SAMPLE_TIME / max(first, 1e-9)))
+    samples = [sum(once() for _ in range(number)) / number for _ in range(repeat)]
+
+    if cold:
+        clear_caches()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        min_ms=min(samples) * 1000,
+        median_ms=statistics.median(samples) * 1000,
+        py_heap_peak_kib=peak / 1024,
+    )
+
+
+def format_delta(curr: Result, base: dict[str, float] | None, threshold: float):
+    if not base:
+        return "", False
+    delta = curr.median_ms / base["median_ms"] - 1 if base["median_ms"] else 0.0
+    regressed = delta > threshold
+    return f"{delta:>+8.1%}{' !' if regressed else ''}", regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", "--filter", default="", help="按名字筛选要运行的项目")
+    parser.add_argument("-r", "--repeat", type=int, default=15)
+    parser.add_argument("--cold", action="store_true", help="每次运行前清空渲染缓存")
+    parser.add_argument("--baseline", type=Path, help="与此基线文件对比")
+    parser.add_argument("--save-baseline", type=Path, help="将结果保存为基线文件")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="中位数变慢超过此比例视为退化",
+    )
+    args = parser.parse_args()
+
+    baseline: dict[str, dict[str, float]] = {}
+    if args.baseline:
+        data = json.loads(args.baseline.read_text("u8"))
+        if data["meta"]["cold"] != args.cold:
+            print("warning: baseline was recorded with a different --cold setting")
+        baseline = data["results"]
+
+    benches = {k: v for k, v in collect().items() if args.filter in k}
+    results: dict[str, Result] = {}
+    regressions = []
+    name_width = max(map(len, benches), default=4)
+    print(
+        f"{'name':<{name_width}} {'min':>10} {'median':>10} {'py heap':>10}"
+        f"{' baseline':>11} {'delta':>9}",
+    )
+    for name, func in benches.items():
+        res = results[name] = measure(func, args.repeat, args.cold)
+        base = baseline.get(name)
+        delta, regressed = format_delta(res, base, args.threshold)
+        if regressed:
+            regressions.append(name)
+        base_txt = f"{base['median_ms']:>9.3f}ms" if base else ""
+        print(
+            f"{name:<{name_width}} {res.min_ms:>8.3f}ms {res.median_ms:>8.3f}ms"
+            f" {res.py_heap_peak_kib:>7.0f}KiB {base_txt:>11} {delta}",
+            flush=True,
+        )
+
+    if args.save_baseline:
+        args.save_baseline.write_text(
+            json.dumps(
+                {
+                    "meta": {
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "cold": args.cold,
+                        "repeat": args.repeat,
+                    },
+                    "results": {k: asdict(v) for k, v in results.items()},
+                },
+                indent=2,
+            ),
+            "u8",
+        )
+        print(f"baseline saved to {args.save_baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
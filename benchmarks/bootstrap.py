@@ -0,0 +1,7 @@
+# 直接运行脚本时 sys.path 中只有 benchmarks 目录，加入仓库根目录以便导入插件
+# 各脚本在导入插件之前先 import 这个模块
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
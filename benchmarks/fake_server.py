@@ -0,0 +1,283 @@
+# 本地的假 Minecraft 服务器，支持 Java 版 Server List Ping（握手、状态、ping）
+# 与基岩版 RakNet Unconnected Ping，可以设置 MOTD、人为延迟与故障注入
+# 用法：python benchmarks/fake_server.py --payload forge_520 --latency 30 --fail-rate .1
+# 不依赖 NoneBot，也可以在其他脚本中导入 FakeServerConfig 与 serve 使用
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+from dataclasses import dataclass, field
+from typing import Any, Literal, TypeAlias
+
+from fixtures import bedrock_fixtures, java_fixtures
+
+FailMode: TypeAlias = Literal["timeout", "close", "garbage"]
+
+RAKNET_UNCONNECTED_PING = 0x01
+RAKNET_UNCONNECTED_PONG = 0x1C
+RAKNET_MAGIC = bytes.fromhex("00ffff00fefefefefdfdfdfd12345678")
+SERVER_GUID = 0x1234567890ABCDEF
+
+
+@dataclass
+class FakeServerConfig:
+    host: str = "127.0.0.1"
+    java_port: int = 25600
+    bedrock_port: int = 19200
+    # 从 java_port / bedrock_port 开始连续监听多少个端口，用来模拟多个不同的服务器
+    ports: int = 1
+    java_status: dict[str, Any] = field(
+        default_factory=lambda: dict(java_fixtures()["plain"].raw),
+    )
+    bedrock_motd: str = field(
+        default_factory=lambda: bedrock_motd_from_fixture("plain")
+    )
+    # 每次回复前的延迟（毫秒），以及在此基础上随机增加的最大值
+    latency: float = 0
+    jitter: float = 0
+    fail_rate: float = 0
+    fail_mode: FailMode = "timeout"
+    # 模拟原版服务端，回复一次 ping 后断开连接
+    close_after_pong: bool = False
+
+
+def bedrock_motd_from_fixture(name: str) -> str:
+    res = bedrock_fixtures()[name]
+    return ";".join(
+        (
+            res.version.brand,
+            res.motd.raw,  # type: ignore
+            str(res.version.protocol),
+            res.version.name,
+            str(res.players.online),
+            str(res.players.max),
+            str(SERVER_GUID),
+            res.map_name or "",
+            res.gamemode or "",
+        ),
+    )
+
+
+def pack_varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+async def read_varint(reader: asyncio.StreamReader) -> int:
+    n = shift = 0
+    while True:
+        b = (await reader.readexactly(1))[0]
+        n |= (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            return n
+        if shift > 35:
+            raise ValueError("VarInt too big")
+
+
+async def read_packet(reader: asyncio.StreamReader) -> bytes:
+    return await reader.readexactly(await read_varint(reader))
+
+
+def pack_packet(packet_id: int, payload: bytes) -> bytes:
+    body = pack_varint(packet_id) + payload
+    return pack_varint(len(body)) + body
+
+
+class FakeServer:
+    def __init__(self, config: FakeServerConfig) -> None:
+        self.config = config
+        self.status_data = json.dumps(config.java_status).encode()
+        self.requests = 0
+        self.failures = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    async def delay(self) -> None:
+        cfg = self.config
+        if delay := cfg.latency + random.uniform(0, cfg.jitter):
+            await asyncio.sleep(delay / 1000)
+
+    def should_fail(self) -> bool:
+        if self.config.fail_rate and random.random() < self.config.fail_rate:
+            self.failures += 1
+            return True
+        return False
+
+    async def handle_java(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.requests += 1
+        failing = self.should_fail()
+        try:
+            await read_packet(reader)  # 握手
+            while True:
+                data = await read_packet(reader)
+                await self.delay()
+                if failing:
+                    await self.fail_java(writer)
+                    return
+                if data[0] == 0x00:  # 状态请求
+                    payload = pack_varint(len(self.status_data)) + self.status_data
+                    writer.write(pack_packet(0x00, payload))
+                elif data[0] == 0x01:  # ping
+                    writer.write(pack_packet(0x01, data[1:9]))
+                    if self.config.close_after_pong:
+                        await writer.drain()
+                        return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def fail_java(self, writer: asyncio.StreamWriter) -> None:
+        mode = self.config.fail_mode
+        if mode == "timeout":
+            await asyncio.sleep(3600)
+        elif mode == "garbage":
+            payload = b"{not json"
+            writer.write(pack_packet(0x00, pack_varint(len(payload)) + payload))
+            await writer.drain()
+
+    def handle_bedrock(
+        self,
+        transport: asyncio.DatagramTransport,
+        data: bytes,
+        addr: tuple[str, int],
+    ) -> None:
+        if not data or data[0] != RAKNET_UNCONNECTED_PING:
+            return
+        self.requests += 1
+        if self.should_fail():
+            # UDP 没有连接可断开，close 与 timeout 一样直接不回复
+            if self.config.fail_mode == "garbage":
+                transport.sendto(bytes([RAKNET_UNCONNECTED_PONG]) + os.urandom(8), addr)
+            return
+
+        motd = self.config.bedrock_motd.encode()
+        resp = (
+            bytes([RAKNET_UNCONNECTED_PONG])
+            + data[1:9]  # 客户端发来的时间戳
+            + struct.pack(">Q", SERVER_GUID)
+            + RAKNET_MAGIC
+            + struct.pack(">H", len(motd))
+            + motd
+        )
+
+        async def reply():
+            await self.delay()
+            transport.sendto(resp, addr)
+
+        task = asyncio.create_task(reply())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def start(self) -> list[Any]:
+        cfg = self.config
+        loop = asyncio.get_running_loop()
+        servers: list[Any] = []
+        for i in range(cfg.ports):
+            servers.append(
+                await asyncio.start_server(
+                    self.handle_java,
+                    cfg.host,
+                    cfg.java_port + i,
+                ),
+            )
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: BedrockProtocol(self),
+                local_addr=(cfg.host, cfg.bedrock_port + i),
+            )
+            servers.append(transport)
+        return servers
+
+
+class BedrockProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: FakeServer) -> None:
+        self.server = server
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        if self.transport:
+            self.server.handle_bedrock(self.transport, data, addr)
+
+
+async def serve(config: FakeServerConfig, ready: Any = None) -> None:
+    server = FakeServer(config)
+    await server.start()
+    if ready is not None:
+        ready.set()
+    await asyncio.Event().wait()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--java-port", type=int, default=25600)
+    parser.add_argument("--bedrock-port", type=int, default=19200)
+    parser.add_argument("--ports", type=int, default=1, help="连续监听的端口数")
+    parser.add_argument(
+        "--payload",
+        default="plain",
+        choices=list(java_fixtures()),
+        help="Java 版状态使用 fixtures.py 中的哪个数据",
+    )
+    parser.add_argument(
+        "--bedrock-payload",
+        default="plain",
+        choices=list(bedrock_fixtures()),
+    )
+    parser.add_argument("--latency", type=float, default=0, help="回复延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="随机额外延迟（毫秒）")
+    parser.add_argument("--fail-rate", type=float, default=0, help="故障注入概率")
+    parser.add_argument(
+        "--fail-mode",
+        default="timeout",
+        choices=["timeout", "close", "garbage"],
+    )
+    parser.add_argument("--close-after-pong", action="store_true")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeServerConfig:
+    return FakeServerConfig(
+        host=args.host,
+        java_port=args.java_port,
+        bedrock_port=args.bedrock_port,
+        ports=args.ports,
+        java_status=dict(java_fixtures()[args.payload].raw),
+        bedrock_motd=bedrock_motd_from_fixture(args.bedrock_payload),
+        latency=args.latency,
+        jitter=args.jitter,
+        fail_rate=args.fail_rate,
+        fail_mode=args.fail_mode,
+        close_after_pong=args.close_after_pong,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    config = config_from_args(parser.parse_args())
+    print(
+        f"Java: {config.host}:{config.java_port}"
+        f"~{config.java_port + config.ports - 1}, "
+        f"Bedrock: {config.host}:{config.bedrock_port}"
+        f"~{config.bedrock_port + config.ports - 1}",
+    )
+    asyncio.run(serve(config))
+
+
+if __name__ == "__main__":
+    main()
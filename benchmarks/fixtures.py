@@ -0,0 +1,116 @@
+# 基准测试用的合成服务器状态，不需要联网
+
+import base64
+import random
+from io import BytesIO
+from typing import Any
+
+from mcstatus.responses import BedrockStatusResponse, JavaStatusResponse
+from PIL import Image
+
+PLAIN_MOTD = "A Minecraft Server"
+FORMATTED_MOTD = (
+    "§6§l✦ §e§lSky§6§lBlock §c§lNetwork §6§l✦§r §7[§a1.8§7-§a1.21§7]\n"
+    "§k||§r §b§lNew Season§r §7| §d§oMinigames§r §7| §a§oPvP§r §k||"
+)
+# 带 JSON 文本组件与十六进制颜色的 MOTD
+FORMATTED_MOTD_JSON: dict[str, Any] = {
+    "text": "",
+    "extra": [
+        *(
+            {"text": ch, "color": f"#{(i * 0x1F3A5B) & 0xFFFFFF:06x}", "bold": True}
+            for i, ch in enumerate("Rainbow Server")
+        ),
+        {"text": "\n"},
+        {"text": "Obfuscated ", "color": "gray"},
+        {"text": "secret", "obfuscated": True, "color": "red"},
+        {"text": " and ", "color": "gray"},
+        {"text": "italic", "italic": True, "color": "aqua"},
+    ],
+}
+
+
+def make_favicon(size: int = 512, seed: int = 0) -> str:
+    # 随机噪点压缩率很低，用来模拟体积很大的图标
+    rnd = random.Random(seed)
+    img = Image.frombytes("RGB", (size, size), rnd.randbytes(size * size * 3))
+    buf = BytesIO()
+    img.save(buf, "png")
+    return f"data:image/png;base64,{base64.b64encode(buf.getvalue()).decode()}"
+
+
+def make_players(count: int) -> list[dict[str, str]]:
+    return [
+        {"name": f"§{'abcde'[i % 5]}Player_{i:02d}", "id": f"{i:032x}"}
+        for i in range(count)
+    ]
+
+
+def make_forge_mods(count: int) -> dict[str, Any]:
+    return {
+        "type": "FML",
+        "modList": [
+            {"modid": f"examplemod{i:03d}", "version": f"1.{i % 20}.{i % 7}"}
+            for i in range(count)
+        ],
+    }
+
+
+def make_java(
+    description: str | dict[str, Any] = PLAIN_MOTD,
+    players: int = 0,
+    mods: int = 0,
+    favicon: str | None = None,
+    latency: float = 23.4,
+) -> JavaStatusResponse:
+    raw: dict[str, Any] = {
+        "version": {"name": "Paper 1.21.4", "protocol": 772},
+        "players": {"online": players, "max": 100},
+        "description": description,
+        "enforcesSecureChat": True,
+    }
+    if players:
+        raw["players"]["sample"] = make_players(players)
+    if mods:
+        raw["modinfo"] = make_forge_mods(mods)
+    if favicon:
+        raw["favicon"] = favicon
+    return JavaStatusResponse.build(raw, latency=latency)  # type: ignore
+
+
+def make_bedrock(
+    motd: str = PLAIN_MOTD,
+    latency: float = 23.4,
+) -> BedrockStatusResponse:
+    return BedrockStatusResponse.build(
+        [
+            "MCPE",
+            motd,
+            "766",
+            "1.21.50",
+            "3",
+            "20",
+            "1234567890",
+            "Bedrock level",
+            "Survival",
+        ],
+        latency=latency,
+    )
+
+
+def java_fixtures() -> dict[str, JavaStatusResponse]:
+    return {
+        "plain": make_java(),
+        "formatted": make_java(FORMATTED_MOTD),
+        "formatted_json": make_java(FORMATTED_MOTD_JSON),
+        "players_12": make_java(FORMATTED_MOTD, players=12),
+        "forge_520": make_java(FORMATTED_MOTD, players=12, mods=520),
+        "big_favicon": make_java(FORMATTED_MOTD, favicon=make_favicon()),
+    }
+
+
+def bedrock_fixtures() -> dict[str, BedrockStatusResponse]:
+    return {
+        "plain": make_bedrock(),
+        "formatted": make_bedrock(FORMATTED_MOTD.replace("\n", " ")),
+    }
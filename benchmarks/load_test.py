@@ -0,0 +1,192 @@
+# 压力测试：在子进程中启动 fake_server.py 的假服务器，以指定并发数调用 draw()
+# 输出请求耗时的 p50 / p95 / p99、吞吐量与事件循环延迟
+# 用法：
+#   python benchmarks/load_test.py -c 32 -n 500 --ports 16 --latency 20
+#   python benchmarks/load_test.py -c 8 --duration 30 --edition be --fail-rate 0.05
+#   python benchmarks/load_test.py --target 127.0.0.1:25565  # 使用已经在运行的服务器
+# 默认关闭状态缓存与图片缓存，使每个请求都走完整流程，--cache 可以保留插件的缓存配置
+
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import time
+from typing import Any
+
+import bootstrap  # noqa: F401
+from fake_server import FakeServerConfig, add_arguments, config_from_args, serve
+
+LAG_INTERVAL = 0.01
+
+
+def run_server(config: FakeServerConfig, ready: Any) -> None:
+    asyncio.run(serve(config, ready))
+
+
+def percentiles(samples: list[float]) -> tuple[float, float, float]:
+    if len(samples) < 2:
+        v = samples[0] if samples else 0.0
+        return v, v, v
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return q[49], q[94], q[98]
+
+
+def format_ms(samples: list[float]) -> str:
+    p50, p95, p99 = percentiles(samples)
+    return (
+        f"p50 {p50 * 1000:.1f}ms / p95 {p95 * 1000:.1f}ms / p99 {p99 * 1000:.1f}ms"
+        f" / max {max(samples, default=0) * 1000:.1f}ms"
+    )
+
+
+async def monitor_lag(lags: list[float], stop: asyncio.Event) -> None:
+    # 定时 sleep，实际醒来时间与预期的差值就是事件循环被阻塞的时间
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+
+async def run_load(args: argparse.Namespace, addresses: list[str]) -> None:
+    from nonebot_plugin_picmcstat import draw
+    from nonebot_plugin_picmcstat.render import get_executor
+    from nonebot_plugin_picmcstat.schedule import QueueFullError
+
+    errors = 0
+    shed = 0
+    orig_render_error = draw.render_error
+
+    async def counting_render_error(*a, **kw):
+        nonlocal errors
+        errors += 1
+        return await orig_render_error(*a, **kw)
+
+    draw.render_error = counting_render_error
+
+    async def request(i: int) -> float:
+        nonlocal shed
+        start = time.perf_counter()
+        try:
+            await draw.draw(
+                addresses[i % len(addresses)],
+                args.edition,
+                f"group{i % args.groups}",
+            )
+        except QueueFullError:
+            shed += 1
+        return time.perf_counter() - start
+
+    # 预热：排版缓存、渲染线程/进程池等
+    await asyncio.to_thread(draw.prewarm_text_cache)
+    await asyncio.gather(*(request(i) for i in range(args.warmup)))
+    errors = shed = 0
+
+    latencies: list[float] = []
+    lags: list[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_lag(lags, stop))
+    counter = iter(range(args.requests or 2**62))
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async def worker():
+        for i in counter:
+            if deadline and time.perf_counter() > deadline:
+                return
+            latencies.append(await request(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+
+    draw.render_error = orig_render_error
+    if executor := get_executor():
+        executor.shutdown()
+
+    print(
+        f"edition: {args.edition}, concurrency: {args.concurrency}, "
+        f"addresses: {len(addresses)}, cache: {'on' if args.cache else 'off'}, "
+        f"render backend: {args.render_backend}",
+    )
+    print(
+        f"requests:   {len(latencies)} in {elapsed:.2f}s"
+        f" ({errors} errors, {shed} rejected)",
+    )
+    print(f"throughput: {len(latencies) / elapsed:.2f} req/s")
+    print(f"latency:    {format_ms(latencies)}")
+    print(f"loop lag:   {format_ms(lags)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("--duration", type=float, help="运行时长（秒），会忽略 -n")
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--groups", type=int, default=1, help="模拟的请求来源数")
+    parser.add_argument("--edition", default="je", choices=["je", "be", "auto"])
+    parser.add_argument("--target", nargs="*", help="不启动假服务器，直接测试这些地址")
+    parser.add_argument("--cache", action="store_true", help="保留插件的缓存配置")
+    parser.add_argument(
+        "--render-backend",
+        default="thread",
+        choices=["inline", "thread", "process"],
+    )
+    parser.add_argument("--render-workers", type=int)
+    parser.add_argument("--probe-concurrency", type=int, default=32)
+    parser.add_argument("--render-concurrency", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument(
+        "--shed-policy",
+        default="stale",
+        choices=["stale", "text", "drop"],
+    )
+    args = parser.parse_args()
+    if args.duration:
+        args.requests = 0
+
+    server = None
+    if args.target:
+        addresses = args.target
+    else:
+        config = config_from_args(args)
+        port = config.bedrock_port if args.edition == "be" else config.java_port
+        addresses = [f"{config.host}:{port + i}" for i in range(config.ports)]
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(
+            target=run_server,
+            args=(config, ready),
+            daemon=True,
+        )
+        server.start()
+        if not ready.wait(10):
+            raise RuntimeError("Fake server failed to start")
+
+    import nonebot
+
+    plugin_config: dict[str, Any] = {
+        "mcstat_resolve_dns": False,
+        "mcstat_render_backend": args.render_backend,
+        "mcstat_render_workers": args.render_workers,
+        "mcstat_probe_concurrency": args.probe_concurrency,
+        "mcstat_render_concurrency": args.render_concurrency,
+        "mcstat_queue_size": args.queue_size,
+        "mcstat_shed_policy": args.shed_policy,
+        "log_level": "WARNING",
+    }
+    if not args.cache:
+        plugin_config.update(mcstat_status_cache_ttl=0, mcstat_image_cache_size=0)
+    nonebot.init(**plugin_config)
+    nonebot.load_plugin("nonebot_plugin_picmcstat")
+
+    try:
+        asyncio.run(run_load(args, addresses))
+    finally:
+        if server:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
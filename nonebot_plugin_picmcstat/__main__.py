@@ -1,20 +1,30 @@
+import asyncio
+import importlib
+import re
+from collections.abc import Awaitable
+from io import BytesIO
 from typing import NoReturn
 
-from nonebot import logger, on_command, on_regex
+from nonebot import get_driver, logger, on_command, on_message
 from nonebot.adapters import Event as BaseEvent, Message
 from nonebot.exception import FinishedException
 from nonebot.params import CommandArg, CommandWhitespace
+from nonebot.permission import SUPERUSER
 from nonebot.typing import T_State
-from nonebot_plugin_alconna.uniseg import UniMessage
+from nonebot_plugin_alconna.uniseg import UniMessage, get_target
 
 from .config import ShortcutType, config
-from .draw import ServerType, draw
+from .const import ServerType
+from .metrics import setup_metrics_route, snapshot_caches, snapshot_stages
+from .poll import poller
+from .schedule import QueueFullError
 
 try:
     from nonebot.adapters.onebot.v11 import GroupMessageEvent as OB11GroupMessageEvent
 except ImportError:
     OB11GroupMessageEvent = None
 
+DEFAULT_SVR_TYPE: ServerType = "auto" if config.enable_auto_detect else "je"
 
 motdje_matcher = on_command(
     "motdje",
@@ -30,13 +40,38 @@ motdpe_matcher = on_command(
 motd_matcher = on_command(
     "motd",
     priority=99,
-    state={"svr_type": "auto" if config.enable_auto_detect else "je"},
+    state={"svr_type": DEFAULT_SVR_TYPE},
 )
+motdbatch_matcher = on_command(
+    "motdbatch",
+    aliases={"motd批量"},
+    priority=98,
+)
+motdstats_matcher = on_command(
+    "motdstats",
+    aliases={"motd统计"},
+    permission=SUPERUSER,
+    priority=97,
+    block=True,
+)
+
+
+def get_group(event: BaseEvent) -> str:
+    # 同一个群 / 频道 / 私聊的请求算作一组
+    try:
+        target = get_target(event)
+    except Exception:
+        return event.get_session_id()
+    return f"{'private' if target.private else 'group'}:{target.parent_id}:{target.id}"
 
 
-async def finish_with_query(ip: str, svr_type: ServerType) -> NoReturn:
+async def finish_with_image(image: Awaitable[BytesIO | bytes]) -> NoReturn:
     try:
-        ret = await draw(ip, svr_type)
+        ret = await image
+    except QueueFullError:
+        if config.shed_policy == "drop":
+            raise FinishedException from None
+        msg = UniMessage("当前查询的人太多了，请稍后再试")
     except Exception:
         msg = UniMessage("出现未知错误，请检查后台输出")
     else:
@@ -45,10 +80,22 @@ async def finish_with_query(ip: str, svr_type: ServerType) -> NoReturn:
     raise FinishedException
 
 
+async def finish_with_query(
+    ip: str,
+    svr_type: ServerType,
+    group: str | None = None,
+) -> NoReturn:
+    # 渲染相关的模块（Pillow、skia、mcstatus 等）导入较慢，第一次用到时再导入
+    from .draw import draw
+
+    await finish_with_image(draw(ip, svr_type, group))
+
+
 @motd_matcher.handle()
 @motdje_matcher.handle()
 @motdpe_matcher.handle()
 async def _(
+    event: BaseEvent,
     state: T_State,
     arg_msg: Message = CommandArg(),
     space: str | None = CommandWhitespace(),
@@ -57,27 +104,131 @@ async def _(
         return
     arg = arg_msg.extract_plain_text().strip()
     svr_type: ServerType = state["svr_type"]
-    await finish_with_query(arg, svr_type)
+    await finish_with_query(arg, svr_type, get_group(event))
+
+
+# 参数中的服务器组名展开为组里的服务器，其他的当作地址，去掉重复的服务器
+def parse_batch_args(args: list[str]) -> list[tuple[str, ServerType]]:
+    servers: list[tuple[str, ServerType]] = []
+    for arg in args:
+        if (items := config.server_groups.get(arg)) is not None:
+            servers.extend((x.host, x.type) for x in items)
+        else:
+            servers.append((arg, DEFAULT_SVR_TYPE))
+    return list(dict.fromkeys(servers))
+
+
+@motdbatch_matcher.handle()
+async def _(
+    event: BaseEvent,
+    arg_msg: Message = CommandArg(),
+    space: str | None = CommandWhitespace(),
+):
+    if arg_msg and (space is None):
+        return
+    args = arg_msg.extract_plain_text().split()
+    group = get_group(event)
+    if not args:
+        await finish_with_query("", DEFAULT_SVR_TYPE, group)
+
+    servers = parse_batch_args(args)
+    if len(servers) > config.batch_max_servers:
+        await UniMessage(
+            f"一次最多查询 {config.batch_max_servers} 个服务器",
+        ).finish(reply_to=config.reply_target)
+
+    from .draw import draw_batch
+
+    title = args[0] if len(args) == 1 and args[0] in config.server_groups else None
+    await finish_with_image(draw_batch(servers, title, group))
 
 
-def append_shortcut_handler(shortcut: ShortcutType):
-    async def rule(event: BaseEvent):  # type: ignore[override]
-        if not OB11GroupMessageEvent:
-            logger.warning("快捷指令群号白名单仅可在 OneBot V11 适配器下使用")
-        elif (wl := shortcut.whitelist) and isinstance(event, OB11GroupMessageEvent):
-            return event.group_id in wl
-        return True
+@motdstats_matcher.handle()
+async def _():
+    from .draw import draw_stats
+    from .render import run_render
+
+    try:
+        ret = await run_render(draw_stats, snapshot_stages(), snapshot_caches())
+    except Exception:
+        logger.exception("画运行统计图失败")
+        msg = UniMessage("出现未知错误，请检查后台输出")
+    else:
+        msg = UniMessage.image(raw=ret)
+    await msg.finish(reply_to=config.reply_target)
+
+
+def check_shortcut_whitelist(shortcut: ShortcutType, event: BaseEvent) -> bool:
+    if not OB11GroupMessageEvent:
+        logger.warning("快捷指令群号白名单仅可在 OneBot V11 适配器下使用")
+    elif (wl := shortcut.whitelist) and isinstance(event, OB11GroupMessageEvent):
+        return event.group_id in wl
+    return True
+
+
+# 所有快捷指令共用一个事件响应器，按配置顺序使用第一个匹配的
+async def shortcut_rule(event: BaseEvent, state: T_State) -> bool:
+    try:
+        msg = str(event.get_message())
+    except Exception:
+        return False
+    for shortcut in config.shortcuts:
+        if re.search(shortcut.regex, msg) and check_shortcut_whitelist(
+            shortcut,
+            event,
+        ):
+            state["shortcut"] = shortcut
+            return True
+    return False
 
-    async def handler():
-        await finish_with_query(shortcut.host, shortcut.type)
 
-    on_regex(shortcut.regex, rule=rule, priority=99).append_handler(handler)
+async def shortcut_handler(event: BaseEvent, state: T_State):
+    shortcut: ShortcutType = state["shortcut"]
+    if shortcut.poll_interval > 0:
+        data = poller.get((shortcut.host, shortcut.type), get_group(event))
+        await finish_with_image(data)
+    await finish_with_query(shortcut.host, shortcut.type, get_group(event))
+
+
+_warmup_task: asyncio.Task | None = None
+
+
+async def warmup():
+    try:
+        # 在线程中导入，避免阻塞事件循环
+        draw_module = await asyncio.to_thread(
+            importlib.import_module,
+            ".draw",
+            __package__,
+        )
+        await draw_module.warmup()
+    except Exception:
+        logger.exception("预热失败")
 
 
 def startup():
-    if s := config.shortcuts:
-        for v in s:
-            append_shortcut_handler(v)
+    setup_metrics_route()
+    if config.shortcuts:
+        on_message(rule=shortcut_rule, priority=99).append_handler(shortcut_handler)
 
 
 startup()
+
+
+@get_driver().on_startup
+async def _():
+    global _warmup_task
+    if config.render_backend == "process":
+        # 要在预热、轮询等创建线程之前 fork 出渲染进程
+        from .render import start_render_pool
+
+        start_render_pool()
+    if config.warmup:
+        # 在后台进行，不阻塞启动
+        _warmup_task = asyncio.create_task(warmup())
+    poller.start()
+
+
+@get_driver().on_shutdown
+async def _():
+    await poller.stop()
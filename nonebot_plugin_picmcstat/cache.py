@@ -0,0 +1,188 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, TypeVar, overload
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+T = TypeVar("T")
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.miss_time = 0.0  # 未命中时生成值花费的总时间（秒），需要调用方自行累加
+
+    @property
+    def total(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.total if self.total else 0.0
+
+    @property
+    def saved_time(self) -> float:
+        # 按未命中时的平均耗时估算
+        return self.hits * self.miss_time / self.misses if self.misses else 0.0
+
+    def __str__(self) -> str:
+        return f"命中 {self.hits} / 未命中 {self.misses} ({self.hit_rate:.2%})"
+
+
+class TTLCache(Generic[K, V]):
+    def __init__(self, ttl: float, maxsize: int) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self._peek(key) is not None
+
+    def _peek(self, key: K) -> tuple[float, V] | None:
+        if (item := self._data.get(key)) is None:
+            return None
+        if item[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    @overload
+    def get(self, key: K) -> V | None: ...
+    @overload
+    def get(self, key: K, default: T) -> V | T: ...
+
+    def get(self, key: K, default: object = None) -> object:
+        if (item := self._peek(key)) is None:
+            self.stats.misses += 1
+            return default
+        self.stats.hits += 1
+        self._data.move_to_end(key)
+        return item[1]
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+# 同一个 key 同时只执行一次，其他并发调用共享同一个结果
+# 所有调用方都被取消后，正在执行的任务也会被取消
+class SingleFlight(Generic[K, V]):
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._pending: dict[K, asyncio.Future[V]] = {}
+        self._waiters: dict[K, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._pending
+
+    def _forget(self, key: K, fut: asyncio.Future[V]) -> None:
+        if self._pending.get(key) is fut:
+            del self._pending[key]
+            self._waiters.pop(key, None)
+
+    async def do(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        if (fut := self._pending.get(key)) is not None:
+            self.coalesced += 1
+        else:
+            fut = self._pending[key] = asyncio.ensure_future(func())
+            fut.add_done_callback(lambda f: self._forget(key, f))
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if self._pending.get(key) is fut:
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    fut.cancel()
+            raise
+
+
+# 以条目总大小而不是条目数限制容量的 LRU 缓存，渲染线程中也会用到所以需要加锁
+class SizedLRUCache(Generic[K, V]):
+    def __init__(self, maxbytes: int, sizeof: Callable[[V], int] = len) -> None:
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.stats = CacheStats()
+        self.currbytes = 0
+        self._data: OrderedDict[K, tuple[int, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxbytes > 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    @overload
+    def get(self, key: K) -> V | None: ...
+    @overload
+    def get(self, key: K, default: T) -> V | T: ...
+
+    def get(self, key: K, default: object = None) -> object:
+        with self._lock:
+            if (item := self._data.get(key)) is None:
+                self.stats.misses += 1
+                return default
+            self.stats.hits += 1
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: K, value: V) -> None:
+        size = self.sizeof(value)
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (size, value)
+            self.currbytes += size
+            while self.currbytes > self.maxbytes:
+                _, (old_size, _) = self._data.popitem(last=False)
+                self.currbytes -= old_size
+
+    def _pop(self, key: K) -> V | None:
+        if (item := self._data.pop(key, None)) is None:
+            return None
+        self.currbytes -= item[0]
+        return item[1]
+
+    def pop(self, key: K) -> V | None:
+        with self._lock:
+            return self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.currbytes = 0
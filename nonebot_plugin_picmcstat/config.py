@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Literal
 
 from cookit.pyd import field_validator, model_with_alias_generator
 from nonebot import get_plugin_config
@@ -12,6 +12,12 @@ class ShortcutType(BaseModel):
     host: str
     type: ServerType  # noqa: A003
     whitelist: list[int] | None = []
+    poll_interval: float = 0
+
+
+class ServerGroupItemType(BaseModel):
+    host: str
+    type: ServerType = "auto"  # noqa: A003
 
 
 @model_with_alias_generator(lambda x: f"mcstat_{x}")
@@ -20,16 +26,60 @@ class ConfigClass(BaseModel):
     show_addr: bool = False
     show_delay: bool = True
     show_mods: bool = False
+    mod_list_max_pixels: int = 4_000_000
+    max_canvas_pixels: int = 4096 * 4096
     reply_target: bool = True
     shortcuts: list[ShortcutType] = Field(default_factory=list)
+    server_groups: dict[str, list[ServerGroupItemType]] = Field(default_factory=dict)
     resolve_dns: bool = True
+    dns_cache_size: int = 256
+    dns_negative_ttl: float = 30
     query_twice: bool = True
+    latency_samples: int = 3
+    bedrock_latency_samples: int = 1
     java_protocol_version: int = 772
     enable_auto_detect: bool = True
+    auto_detect_memory_ttl: float = 3600
+    render_backend: Literal["inline", "thread", "process"] = "thread"
+    render_workers: int | None = None
+    status_cache_ttl: float = 10
+    status_cache_size: int = 128
+    image_cache_size: int = 16 * 1024 * 1024
+    image_cache_latency_bucket: float = 10
+    text_cache_size: int = 2048
+    image_format: Literal["jpeg", "png", "webp"] = "jpeg"
+    image_quality: int | None = None
+    image_png_colors: int = 0
+    image_max_bytes: int = 0
+    animate_obfuscated: bool = False
+    animation_format: Literal["gif", "webp"] = "gif"
+    animation_frames: int = 8
+    animation_frame_time: int = 100
+    metrics_path: str | None = None
+    probe_concurrency: int = 32
+    render_concurrency: int = 8
+    queue_size: int = 64
+    shed_policy: Literal["stale", "text", "drop"] = "stale"
+    warmup: bool = True
+    batch_concurrency: int = 8
+    batch_max_servers: int = 20
+    poll_fresh_ttl: float = 60
+    poll_jitter: float = 0.1
+    poll_concurrency: int = 2
 
     @field_validator("font", mode="before")
     def transform_to_list(cls, v: Any):  # noqa: N805
         return v if isinstance(v, list) else [v]
 
+    @field_validator("server_groups", mode="before")
+    def transform_group_items(cls, v: Any):  # noqa: N805
+        # 组里的服务器可以只写地址
+        if not isinstance(v, dict):
+            return v
+        return {
+            k: [{"host": x} if isinstance(x, str) else x for x in items]
+            for k, items in v.items()
+        }
+
 
 config = get_plugin_config(ConfigClass)
@@ -1,8 +1,6 @@
 import re
 from typing import Literal, TypeAlias
 
-from mcstatus.motd.components import Formatting, MinecraftColor
-
 ServerTypeRaw: TypeAlias = Literal["je", "be"]
 ServerType: TypeAlias = Literal[ServerTypeRaw, "auto"]
 
@@ -57,13 +55,5 @@ OBFUSCATED_PLACEHOLDER_REGEX = re.compile(
     r"\[obfuscated\](?P<inner>.*?)\[/obfuscated\]",
 )
 
-ENUM_CODE_COLOR = {MinecraftColor(k): v for k, v in CODE_COLOR.items()}
-ENUM_STROKE_COLOR = {MinecraftColor(k): v for k, v in STROKE_COLOR.items()}
-ENUM_CODE_COLOR_BEDROCK = {MinecraftColor(k): v for k, v in CODE_COLOR_BEDROCK.items()}
-ENUM_STROKE_COLOR_BEDROCK = {
-    MinecraftColor(k): v for k, v in STROKE_COLOR_BEDROCK.items()
-}
-ENUM_STYLE_BBCODE = {Formatting(k): v for k, v in STYLE_BBCODE.items()}
-
 GAME_MODE_MAP = {"Survival": "生存", "Creative": "创造", "Adventure": "冒险"}
 FORMAT_CODE_REGEX = r"§[0-9abcdefgklmnor]"
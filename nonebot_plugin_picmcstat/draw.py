@@ -1,32 +1,64 @@
+import asyncio
 import base64
+import hashlib
+import json
+import math
 import socket
-from collections.abc import Sequence
+import string
+import time
+from collections.abc import Callable, Hashable, Iterable, Iterator, Sequence
+from dataclasses import dataclass
 from functools import partial
 from io import BytesIO
 from typing import TYPE_CHECKING, Any, Optional, TypeAlias, Union, cast
 
-from mcstatus import BedrockServer, JavaServer
-from mcstatus.motd import Motd
 from mcstatus.status_response import JavaStatusResponse
 from nonebot import get_driver
 from nonebot.log import logger
+from PIL import Image
 from PIL.Image import Resampling
 from pil_utils import BuildImage, Text2Image
+from skia import (
+    Color4f,
+    FontMgr,
+    Surfaces,
+    kRGBA_8888_ColorType,
+    kUnpremul_AlphaType,
+)
 
+from .cache import SingleFlight, SizedLRUCache
 from .config import config
-from .const import CODE_COLOR, GAME_MODE_MAP, STROKE_COLOR, ServerType, ServerTypeRaw
-from .res import DEFAULT_ICON_RES, DIRT_RES, GRASS_RES
+from .const import CODE_COLOR, GAME_MODE_MAP, STROKE_COLOR, ServerType
+from .encode import encode_animation, encode_image
+from .metrics import (
+    STAGES,
+    CacheSnapshot,
+    StageSnapshot,
+    register_cache,
+    timer,
+)
+from .query import (
+    AutoDetectError,
+    LatencyStats,
+    ServerStatus,
+    query_status,
+    query_status_auto,
+)
+from .render import run_render
+from .res import get_default_icon_res, get_dirt_res, get_grass_res
+from .schedule import QueueFullError, group_context
 from .util import (
-    BBCodeTransformer,
     chunks,
+    fill_obfuscated,
     format_mod_list,
     get_latency_color,
-    resolve_ip,
-    split_motd_lines,
-    trim_motd,
+    motd_bbcode_placeholders,
+    name_to_bbcode,
+    normalize_address,
 )
 
 if TYPE_CHECKING:
+    from mcstatus.motd import Motd
     from mcstatus.responses import BedrockStatusResponse
     from pil_utils.typing import ColorType
 
@@ -36,19 +68,130 @@ TITLE_FONT_SIZE = 8 * 5
 EXTRA_FONT_SIZE = 8 * 4
 EXTRA_STROKE_WIDTH = 2
 STROKE_RATIO = 0.0625
+# 画文字的图层四周留出的空间，避免描边被裁掉
+TEXT_LAYER_PADDING = 8
 SPACING = 12
 LIST_GAP = 12
+MOD_LIST_GAP = LIST_GAP * 2
+MOD_LIST_MAX_COLUMNS = 16
+# Mod 列表排版的目标宽高比
+MOD_LIST_ASPECT = 2
+BG_BUCKET_SIZE = 256
+BG_CACHE_SIZE = 64 * 1024 * 1024
+HEADER_BUCKET_SIZE = 16
+HEADER_CACHE_SIZE = 8 * 1024 * 1024
+STATIC_CACHE_SIZE = 4 * 1024 * 1024
+ICON_SIZE = 128
+# 额外信息（ImageGrid 等）在卡片上的位置
+EXTRA_POS = (MARGIN, int(ICON_SIZE + MARGIN + MARGIN / 2))
+BATCH_ICON_SIZE = 64
+BATCH_ROW_SPACING = 4
+ICON_CACHE_SIZE = 8 * 1024 * 1024
+STALE_CACHE_SIZE = 8 * 1024 * 1024
 
 JE_HEADER = "[MCJE服务器信息]"
 BE_HEADER = "[MCBE服务器信息]"
 AUTO_HEADER = "[MC服务器信息]"
+BATCH_HEADER = "[MC服务器列表]"
 SUCCESS_TITLE = "请求成功"
 DEFAULT_ERR_TITLE = "出错了！"
+STATS_HEADER = "[PicMCStat运行统计]"
+
+# 启动时预先排版的固定文字
+LABEL_TEXTS = [
+    "测试地址: ",
+    "服务端名: ",
+    "Mod 端类型: ",
+    "协议版本: ",
+    "游戏版本: ",
+    "当前人数: ",
+    "Mod 总数: ",
+    "聊天签名: ",
+    "存档名称: ",
+    "游戏模式: ",
+    "测试延迟: ",
+    "Mod 列表: ",
+    "玩家列表: ",
+]
+VALUE_TEXTS = ["必需", "无需", *GAME_MODE_MAP.values()]
+# 启动时预先光栅化的字形：可打印 ASCII 字符与固定文字中的字符
+WARMUP_GLYPHS = "".join(
+    dict.fromkeys(
+        string.ascii_letters
+        + string.digits
+        + string.punctuation
+        + "".join(
+            (
+                *LABEL_TEXTS,
+                *VALUE_TEXTS,
+                JE_HEADER,
+                BE_HEADER,
+                AUTO_HEADER,
+                BATCH_HEADER,
+                SUCCESS_TITLE,
+                DEFAULT_ERR_TITLE,
+            ),
+        ).replace(" ", ""),
+    ),
+)
+
+ImageType: TypeAlias = Union[
+    BuildImage,
+    Text2Image,
+    "AnimatedText",
+    "ImageGrid",
+    "ImageColumns",
+]
+
+image_cache: SizedLRUCache[str, bytes] = SizedLRUCache(config.image_cache_size)
+image_flight: SingleFlight[str, bytes] = SingleFlight()
+# 按 BG_BUCKET_SIZE 向上取整后的尺寸缓存铺好的背景，用时裁剪
+bg_cache: SizedLRUCache[tuple[int, int], Image.Image] = SizedLRUCache(
+    BG_CACHE_SIZE,
+    lambda x: x.width * x.height * 4,
+)
+icon_cache: SizedLRUCache[str | None, BuildImage] = SizedLRUCache(
+    ICON_CACHE_SIZE,
+    lambda x: x.width * x.height * 4,
+)
+header_cache: SizedLRUCache[tuple[str, int, int], Image.Image] = SizedLRUCache(
+    HEADER_CACHE_SIZE,
+    lambda x: x.width * x.height * 4,
+)
+# 排版好的 Text2Image，按条目数限制大小
+text_cache: SizedLRUCache[tuple[Any, ...], Text2Image] = SizedLRUCache(
+    config.text_cache_size,
+    lambda _: 1,
+)
+# 使用进程池渲染时，这些缓存在各个子进程中，主进程里的统计没有意义
+register_cache("image", "状态图片", image_cache)
+register_cache("text", "文字排版", text_cache)
+register_cache("bg", "背景", bg_cache)
+register_cache("header", "标题", header_cache)
+register_cache("icon", "服务器图标", icon_cache)
+# 每个地址最后一次成功画出的图，排队已满时作为过时的结果返回
+stale_cache: SizedLRUCache[tuple[str, ServerType], bytes] = SizedLRUCache(
+    STALE_CACHE_SIZE if config.shed_policy == "stale" else 0,
+)
 
-ImageType: TypeAlias = Union[BuildImage, Text2Image, "ImageGrid"]
 
+# 刚创建的段落按无限宽度排版，先按最长的一行重新排版，绘制时不需要再修改
+def make_text(text: str, **kwargs) -> Text2Image:
+    img = Text2Image.from_bbcode_text(text, **kwargs)
+    return img.wrap(math.ceil(img.longest_line))
 
-def ex_default_style(text: str, color_code: str = "", **kwargs) -> Text2Image:
+
+# 只有标签等固定的文字才传入 cache=True，每次请求都不同的文字（地址、人数、Mod 名等）
+# 不要缓存，以免挤掉固定的文字
+# 返回的文字已经按最长的一行排版好，可以直接绘制
+# 缓存的 Text2Image 会被多个请求同时绘制，
+# 不要对它调用 wrap、to_image 之类会修改自身的方法
+def ex_default_style(
+    text: str,
+    color_code: str = "",
+    cache: bool = False,
+    **kwargs,
+) -> Text2Image:
     default_kwargs = {
         "font_size": EXTRA_FONT_SIZE,
         "fill": CODE_COLOR[color_code or "f"],
@@ -58,24 +201,134 @@ def ex_default_style(text: str, color_code: str = "", **kwargs) -> Text2Image:
         # "spacing": EXTRA_SPACING,
     }
     default_kwargs.update(kwargs)
-    return Text2Image.from_bbcode_text(text, **default_kwargs)
+    if not cache:
+        return make_text(text, **default_kwargs)
+
+    key = (
+        text,
+        *(
+            (k, tuple(v) if isinstance(v, list) else v)
+            for k, v in default_kwargs.items()
+        ),
+    )
+    if (img := text_cache.get(key)) is not None:
+        return img
+
+    start = time.perf_counter()
+    img = make_text(text, **default_kwargs)
+    text_cache.stats.miss_time += time.perf_counter() - start
+    text_cache.set(key, img)
+    return img
+
+
+# 固定的值（必需、生存 等）与标签一样缓存，其他值不缓存
+def const_style(text: str) -> Text2Image:
+    return ex_default_style(text, cache=text in VALUE_TEXTS)
+
+
+def prewarm_text_cache():
+    for text in LABEL_TEXTS:
+        ex_default_style(text, "7", cache=True)
+    for text in VALUE_TEXTS:
+        ex_default_style(text, cache=True)
+    logger.debug(f"Prewarmed {len(text_cache)} text layouts")
+
+
+def find_missing_fonts() -> list[str]:
+    try:
+        manager = FontMgr()
+        return [x for x in config.font if not manager.matchFamily(x).count()]
+    except Exception:
+        logger.opt(exception=True).debug("Failed to check font families")
+        return []
+
+
+# 解析字体并按用到的两种字号、常规与粗体光栅化一遍字形，
+# 让字体文件的读取与字形缓存的填充发生在启动时而不是第一次查询时
+def prewarm_fonts():
+    if missing := find_missing_fonts():
+        logger.warning(
+            f"找不到字体 {', '.join(missing)}，将使用备选字体，"
+            f"请安装这些字体或修改配置项 MCSTAT_FONT",
+        )
+    for font_size in (TITLE_FONT_SIZE, EXTRA_FONT_SIZE):
+        for text in (WARMUP_GLYPHS, f"[b]{WARMUP_GLYPHS}[/b]"):
+            ex_default_style(text, font_size=font_size).to_image()
 
 
 def calc_offset(*pos: tuple[float, float]) -> tuple[float, float]:
     return (sum(x[0] for x in pos), sum(x[1] for x in pos))
 
 
+Placement: TypeAlias = tuple[
+    Union[BuildImage, Text2Image, "AnimatedText"],
+    tuple[float, float],
+]
+
+
+# 排版只在第一次用到时算一次，结果缓存在各个节点上，画图时直接使用算好的位置
+# 先把所有图片贴到背景上，再把所有文字画在一个透明图层上一起贴上去
 def draw_image_type_on(bg: BuildImage, it: ImageType, pos: tuple[float, float]):
-    if isinstance(it, ImageGrid):
-        it.draw_on(bg, pos)
-    elif isinstance(it, Text2Image):
-        it.draw_on_image(bg.image, pos)
+    draw_placements(bg, iter_placements(it, pos))
+
+
+def iter_placements(it: ImageType, pos: tuple[float, float]) -> Iterator[Placement]:
+    if isinstance(it, (ImageGrid, ImageColumns)):
+        yield from it.placements(pos)
     else:
-        bg.paste(
-            it,
-            tuple(round(x) for x in pos),  # type: ignore
-            alpha=True,
-        )
+        yield it, pos
+
+
+def draw_placements(bg: BuildImage, placements: Iterable[Placement]) -> None:
+    texts: list[tuple[Text2Image, tuple[float, float]]] = []
+    for it, pos in placements:
+        if isinstance(it, Text2Image):
+            texts.append((it, pos))
+            continue
+        if isinstance(it, AnimatedText):
+            continue
+        img = it.image if it.mode == "RGBA" else it.image.convert("RGBA")
+        bg.image.alpha_composite(img, tuple(round(x) for x in pos))
+    if not texts:
+        return
+
+    # 图层只覆盖文字所在的区域，四周留出描边的空间
+    left = math.floor(min(pos[0] for _, pos in texts)) - TEXT_LAYER_PADDING
+    top = math.floor(min(pos[1] for _, pos in texts)) - TEXT_LAYER_PADDING
+    right = math.ceil(max(pos[0] + t.longest_line for t, pos in texts))
+    bottom = math.ceil(max(pos[1] + t.height for t, pos in texts))
+    layer = paint_texts(
+        (right - left + TEXT_LAYER_PADDING, bottom - top + TEXT_LAYER_PADDING),
+        ((t, (x - left, y - top)) for t, (x, y) in texts),
+    )
+    # 超出背景的部分裁掉
+    box = (max(-left, 0), max(-top, 0))
+    bg.image.alpha_composite(layer, (max(left, 0), max(top, 0)), box)
+
+
+# Text2Image.draw_on_image 每画一段文字都要把整张图转换成 skia 的格式再转换回来，
+# 这里在一个透明图层上一次画完所有文字
+def paint_texts(
+    size: tuple[int, int],
+    texts: Iterable[tuple[Text2Image, tuple[float, float]]],
+) -> Image.Image:
+    surface = Surfaces.MakeRasterN32Premul(*size)
+    canvas = surface.getCanvas()
+    canvas.clear(Color4f.kTransparent)
+    # 文字已经由 ex_default_style 排版好，这里只读取，不能调用 wrap 修改共享的缓存
+    for text, (x, y) in texts:
+        for para in text.paragraphs:
+            if para.stroke_paragraph:
+                para.stroke_paragraph.paint(canvas, x, y)
+            para.paragraph.paint(canvas, x, y)
+            y += para.height
+    surface.flushAndSubmit()
+    return Image.fromarray(
+        surface.makeImageSnapshot().convert(
+            colorType=kRGBA_8888_ColorType,
+            alphaType=kUnpremul_AlphaType,
+        ),
+    )
 
 
 def width(obj: ImageType) -> float:
@@ -84,6 +337,29 @@ def width(obj: ImageType) -> float:
     return obj.width
 
 
+# 含有乱码（§k）的文字的各帧，占用的空间按最大的一帧算
+# 静态图层中不画，由 build_img 逐帧画在各自的区域中
+class AnimatedText:
+    def __init__(self, frames: Sequence[Text2Image]):
+        self.frames = frames
+        self.width = max(x.longest_line for x in frames)
+        self.height = max(x.height for x in frames)
+
+
+# 清掉排版结果的缓存，之后再用到时重新计算
+def reset_layout(it: ImageType) -> None:
+    if isinstance(it, ImageGrid):
+        for line in it:
+            line.reset_layout()
+    if isinstance(it, ImageColumns):
+        for col in it:
+            for x in col:
+                reset_layout(x)
+    if isinstance(it, (ImageGrid, ImageColumns)):
+        it.invalidate()
+
+
+# 创建后不会再修改，尺寸算一次就够了
 class ImageLine:
     def __init__(
         self,
@@ -98,19 +374,31 @@ class ImageLine:
             else None
         )
         self.gap = gap
+        self._size: tuple[float, float] | None = None
 
     @property
     def width(self) -> float:
-        rw = width(self.right) if self.right else 0
-        return width(self.left) + self.gap + rw
+        return self.size[0]
 
     @property
     def height(self) -> float:
-        return max(self.left.height, (self.right.height if self.right else 0))
+        return self.size[1]
 
     @property
     def size(self) -> tuple[float, float]:
-        return self.width, self.height
+        if self._size is None:
+            rw = width(self.right) if self.right else 0
+            self._size = (
+                width(self.left) + self.gap + rw,
+                max(self.left.height, (self.right.height if self.right else 0)),
+            )
+        return self._size
+
+    def reset_layout(self) -> None:
+        reset_layout(self.left)
+        if self.right:
+            reset_layout(self.right)
+        self._size = None
 
 
 class ImageGrid(list[ImageLine]):
@@ -126,6 +414,8 @@ class ImageGrid(list[ImageLine]):
         super().__init__(lines)
         self.spacing = spacing
         self.align_items = align_items
+        # (宽, 高, 左侧一列的宽度)，添加行时清空
+        self._layout: tuple[float, float, float] | None = None
 
     @classmethod
     def from_list(cls, li: Sequence[ImageType | str], **kwargs) -> "ImageGrid":
@@ -134,46 +424,63 @@ class ImageGrid(list[ImageLine]):
             **kwargs,
         )
 
+    def invalidate(self) -> None:
+        self._layout = None
+
+    def append(self, line: ImageLine) -> None:
+        super().append(line)
+        self.invalidate()
+
+    def extend(self, lines: Iterable[ImageLine]) -> None:
+        super().extend(lines)
+        self.invalidate()
+
+    @property
+    def layout(self) -> tuple[float, float, float]:
+        if self._layout is None:
+            left_width = max(width(x.left) for x in self)
+            if self.align_items:
+                # 对齐时右侧一列都从最宽的左侧之后开始
+                grid_width = max(
+                    left_width + x.gap + (width(x.right) if x.right else 0)
+                    for x in self
+                )
+            else:
+                grid_width = max(x.width for x in self)
+            self._layout = (
+                grid_width,
+                sum(x.height for x in self) + self.spacing * (len(self) - 1),
+                left_width,
+            )
+        return self._layout
+
     @property
     def width(self) -> float:
-        return max(x.width for x in self)
+        return self.layout[0]
 
     @property
     def height(self) -> float:
-        return sum(x.height for x in self) + self.spacing * (len(self) - 1)
+        return self.layout[1]
 
     @property
     def size(self) -> tuple[float, float]:
-        return self.width, self.height
+        return self.layout[:2]
 
     def append_line(self, *args, **kwargs):
         self.append(ImageLine(*args, **kwargs))
 
-    def draw_on(self, bg: BuildImage, offset_pos: tuple[float, float]) -> None:
-        max_lw = max(width(x.left) for x in self) if self.align_items else None
-        y_offset = 0
+    def placements(self, offset_pos: tuple[float, float]) -> Iterator[Placement]:
+        max_lw = self.layout[2] if self.align_items else None
+        x, y = offset_pos
         for line in self:
-            line_height = line.height
-            draw_image_type_on(
-                bg,
-                line.left,
-                calc_offset(
-                    offset_pos,
-                    (0, y_offset),
-                    # (0, (line_height - line.left.height)),
-                ),
-            )
+            yield from iter_placements(line.left, (x, y))
             if line.right:
-                draw_image_type_on(
-                    bg,
-                    line.right,
-                    calc_offset(
-                        offset_pos,
-                        ((max_lw or width(line.left)) + line.gap, y_offset),
-                        # (0, (line_height - line.right.height)),
-                    ),
-                )
-            y_offset += line_height + self.spacing
+                right_x = x + (max_lw or width(line.left)) + line.gap
+                yield from iter_placements(line.right, (right_x, y))
+            y += line.height + self.spacing
+
+    def draw_on(self, bg: BuildImage, offset_pos: tuple[float, float]) -> None:
+        draw_placements(bg, self.placements(offset_pos))
 
     def to_image(
         self,
@@ -190,6 +497,122 @@ class ImageGrid(list[ImageLine]):
         return bg
 
 
+# 多列的列表，每列从上往下排列，所有行的高度相同，创建后不会再修改
+class ImageColumns(list[list[ImageType]]):
+    def __init__(
+        self,
+        *columns: list[ImageType],
+        spacing: int = SPACING,
+        gap: int = MOD_LIST_GAP,
+    ):
+        super().__init__(columns)
+        self.spacing = spacing
+        self.gap = gap
+        # (每列的宽度, 行高)
+        self._layout: tuple[list[float], float] | None = None
+
+    def invalidate(self) -> None:
+        self._layout = None
+
+    @property
+    def layout(self) -> tuple[list[float], float]:
+        if self._layout is None:
+            self._layout = (
+                [max((width(x) for x in col), default=0) for col in self],
+                max((x.height for col in self for x in col), default=0),
+            )
+        return self._layout
+
+    @property
+    def line_height(self) -> float:
+        return self.layout[1]
+
+    @property
+    def column_widths(self) -> list[float]:
+        return self.layout[0]
+
+    @property
+    def width(self) -> float:
+        return sum(self.column_widths) + self.gap * (len(self) - 1)
+
+    @property
+    def height(self) -> float:
+        rows = max((len(x) for x in self), default=0)
+        return rows * self.line_height + self.spacing * (rows - 1)
+
+    @property
+    def size(self) -> tuple[float, float]:
+        return self.width, self.height
+
+    def placements(self, offset_pos: tuple[float, float]) -> Iterator[Placement]:
+        column_widths, line_height = self.layout
+        x, y = offset_pos
+        for col, col_width in zip(self, column_widths):
+            for i, item in enumerate(col):
+                item_y = y + i * (line_height + self.spacing)
+                yield from iter_placements(item, (x, item_y))
+            x += col_width + self.gap
+
+    def draw_on(self, bg: BuildImage, offset_pos: tuple[float, float]) -> None:
+        draw_placements(bg, self.placements(offset_pos))
+
+
+def measure_columns(
+    widths: Sequence[float],
+    line_height: float,
+    rows: int,
+) -> tuple[float, float]:
+    col_widths = [max(widths[i : i + rows]) for i in range(0, len(widths), rows)]
+    return (
+        sum(col_widths) + MOD_LIST_GAP * (len(col_widths) - 1),
+        rows * line_height + SPACING * (rows - 1),
+    )
+
+
+# 返回宽高比最接近 MOD_LIST_ASPECT 的排法的行数与尺寸
+def fit_columns(
+    widths: Sequence[float],
+    line_height: float,
+) -> tuple[int, float, float]:
+    best: tuple[float, int, float, float] | None = None
+    for columns in range(1, min(len(widths), MOD_LIST_MAX_COLUMNS) + 1):
+        rows = -(-len(widths) // columns)
+        w, h = measure_columns(widths, line_height, rows)
+        score = max(w, h * MOD_LIST_ASPECT)
+        if best is None or score < best[0]:
+            best = (score, rows, w, h)
+    assert best
+    return best[1:]
+
+
+def draw_mod_list_more(count: int) -> Text2Image:
+    return ex_default_style(f"... 还有 {count} 个", "7")
+
+
+# 把 Mod 列表均匀地分成多列，面积超过 MCSTAT_MOD_LIST_MAX_PIXELS 时
+# 只显示放得下的部分，剩下的用一行“还有 N 个”代替
+# 只用排版好的文字计算尺寸，不会分配画布
+def layout_mod_list(mods: Sequence[str]) -> ImageColumns:
+    items: list[ImageType] = [ex_default_style(x) for x in mods]
+    widths = [width(x) for x in items]
+    line_height = max(x.height for x in items)
+    max_pixels = config.mod_list_max_pixels
+
+    count = len(items)
+    while True:
+        more = len(items) - count
+        shown = [*widths[:count], width(draw_mod_list_more(more))] if more else widths
+        rows, w, h = fit_columns(shown, line_height)
+        if max_pixels <= 0 or w * h <= max_pixels or not count:
+            break
+        count = min(count - 1, int(count * max_pixels / (w * h)))
+
+    cells = items[:count]
+    if more := len(items) - count:
+        cells.append(draw_mod_list_more(more))
+    return ImageColumns(*(list(x) for x in chunks(cells, rows)))
+
+
 def get_header_by_svr_type(svr_type: ServerType) -> str:
     if svr_type == "je":
         return JE_HEADER
@@ -198,32 +621,106 @@ def get_header_by_svr_type(svr_type: ServerType) -> str:
     return AUTO_HEADER
 
 
+def tile_bg(width: int, height: int) -> Image.Image:
+    # BuildImage.paste 每次都会复制整张图，这里直接用 PIL 原地粘贴
+    # 先拼出一行草方块与一行泥土，再把泥土行往下铺
+    grass, dirt = get_grass_res(), get_dirt_res()
+    size = dirt.width
+    grass_row = Image.new("RGBA", (width, size))
+    dirt_row = Image.new("RGBA", (width, size))
+    for wi in range(0, width, size):
+        grass_row.paste(grass.image, (wi, 0))
+        dirt_row.paste(dirt.image, (wi, 0))
+
+    bg = Image.new("RGBA", (width, height))
+    bg.paste(grass_row, (0, 0))
+    for hi in range(size, height, size):
+        bg.paste(dirt_row, (0, hi))
+    return bg
+
+
 def draw_bg(width: int, height: int) -> BuildImage:
-    size = DIRT_RES.width
-    bg = BuildImage.new("RGBA", (width, height))
+    bucket_w = -(-width // BG_BUCKET_SIZE) * BG_BUCKET_SIZE
+    bucket_h = -(-height // BG_BUCKET_SIZE) * BG_BUCKET_SIZE
+    if (canvas := bg_cache.get((bucket_w, bucket_h))) is None:
+        canvas = tile_bg(bucket_w, bucket_h)
+        bg_cache.set((bucket_w, bucket_h), canvas)
+    return BuildImage(canvas.crop((0, 0, width, height)))
+
+
+def draw_header_layer(text: str, width: int, height: int) -> Image.Image:
+    key = (text, width, height)
+    if (layer := header_cache.get(key)) is not None:
+        return layer
+
+    layer = (
+        BuildImage.new("RGBA", (width, height), (0, 0, 0, 0))
+        .draw_text(
+            (0, 0, width, height),
+            text,
+            halign="left",
+            fill=CODE_COLOR["f"],
+            max_fontsize=TITLE_FONT_SIZE,
+            font_families=config.font,
+            stroke_ratio=STROKE_RATIO,
+            stroke_fill=STROKE_COLOR["f"],
+        )
+        .image
+    )
+    header_cache.set(key, layer)
+    return layer
 
-    for hi in range(0, height, size):
-        for wi in range(0, width, size):
-            bg.paste(DIRT_RES if hi else GRASS_RES, (wi, hi))
 
-    return bg
+def draw_header(bg: BuildImage, text: str, box: tuple[float, float, float, float]):
+    # 标题只有几种，按区域宽度分档缓存画好文字的透明图层，省掉每次找合适字号的过程
+    left, top, right, bottom = (round(x) for x in box)
+    layer_width = (right - left) // HEADER_BUCKET_SIZE * HEADER_BUCKET_SIZE
+    bg.image.alpha_composite(
+        draw_header_layer(text, layer_width, bottom - top),
+        (left, top),
+    )
 
 
-def build_img(
+def prepare_icon(icon: BuildImage) -> BuildImage:
+    if icon.size != (ICON_SIZE, ICON_SIZE):
+        icon = icon.resize_height(
+            ICON_SIZE,
+            inside=False,
+            resample=Resampling.NEAREST,
+        )
+    return icon if icon.mode == "RGBA" else icon.convert("RGBA")
+
+
+# 按 favicon 内容的摘要缓存解码、缩放好的图标，None 为默认图标
+def get_icon(icon: str | None) -> BuildImage:
+    key = get_icon_digest(icon)
+    if (img := icon_cache.get(key)) is not None:
+        return img
+
+    img = prepare_icon(
+        BuildImage.open(BytesIO(base64.b64decode(icon.split(",")[-1])))
+        if icon
+        else get_default_icon_res(),
+    )
+    icon_cache.set(key, img)
+    return img
+
+
+class CanvasTooLargeError(ValueError):
+    pass
+
+
+def build_canvas(
     header1: str,
     header2: str,
     icon: BuildImage | None = None,
     extra: ImageType | str | None = None,
-) -> BytesIO:
-    if not icon:
-        icon = DEFAULT_ICON_RES
+) -> BuildImage:
+    icon = prepare_icon(icon) if icon else get_icon(None)
     if isinstance(extra, str):
         extra = ex_default_style(extra)
 
-    header_text_color = CODE_COLOR["f"]
-    header_stroke_color = STROKE_COLOR["f"]
-
-    header_height = 128
+    header_height = ICON_SIZE
     half_header_height = int(header_height / 2)
 
     bg_width = width(extra) + MARGIN * 2 if extra else MIN_WIDTH
@@ -231,60 +728,125 @@ def build_img(
     bg_width = max(bg_width, MIN_WIDTH)
     if extra:
         bg_height += extra.height + int(MARGIN / 2)
+    if 0 < config.max_canvas_pixels < bg_width * bg_height:
+        raise CanvasTooLargeError(f"{round(bg_width)}x{round(bg_height)}")
     bg = draw_bg(round(bg_width), round(bg_height))
 
-    if icon.size != (header_height, header_height):
-        icon = icon.resize_height(
-            header_height,
-            inside=False,
-            resample=Resampling.NEAREST,
-        )
-    bg.paste(icon, (MARGIN, MARGIN), alpha=True)
+    bg.image.paste(icon.image, (MARGIN, MARGIN), mask=icon.image)
 
-    bg.draw_text(
+    draw_header(
+        bg,
+        header1,
         (
             header_height + MARGIN + MARGIN / 2,
             MARGIN - 4,
             bg_width - MARGIN,
             half_header_height + MARGIN + 4,
         ),
-        header1,
-        halign="left",
-        fill=header_text_color,
-        max_fontsize=TITLE_FONT_SIZE,
-        font_families=config.font,
-        stroke_ratio=STROKE_RATIO,
-        stroke_fill=header_stroke_color,
     )
-    bg.draw_text(
+    draw_header(
+        bg,
+        header2,
         (
             header_height + MARGIN + MARGIN / 2,
             half_header_height + MARGIN - 4,
             bg_width - MARGIN,
             header_height + MARGIN + 4,
         ),
-        header2,
-        halign="left",
-        fill=header_text_color,
-        max_fontsize=TITLE_FONT_SIZE,
-        font_families=config.font,
-        stroke_ratio=STROKE_RATIO,
-        stroke_fill=header_stroke_color,
     )
 
     if extra:
         draw_image_type_on(
             bg,
             extra,
-            (MARGIN, int(header_height + MARGIN + MARGIN / 2)),
+            EXTRA_POS,
         )
 
-    return bg.convert("RGB").save("jpeg")
+    return bg
 
 
-def draw_help(svr_type: ServerType) -> BytesIO:
+# 每帧只重画乱码文字所在的区域：从静态图层上裁下包含所有乱码文字的一块区域，
+# 画上这一帧的文字，返回第一帧的完整图片、之后各帧这块区域的图像与区域的左上角坐标
+def draw_animation_frames(
+    canvas: Image.Image,
+    animated: Sequence[tuple["AnimatedText", tuple[float, float]]],
+) -> tuple[Image.Image, list[Image.Image], tuple[int, int]]:
+    box = (
+        max(min(math.floor(x) for _, (x, _) in animated) - TEXT_LAYER_PADDING, 0),
+        max(min(math.floor(y) for _, (_, y) in animated) - TEXT_LAYER_PADDING, 0),
+        min(
+            max(math.ceil(x + it.width) for it, (x, _) in animated)
+            + TEXT_LAYER_PADDING,
+            canvas.width,
+        ),
+        min(
+            max(math.ceil(y + it.height) for it, (_, y) in animated)
+            + TEXT_LAYER_PADDING,
+            canvas.height,
+        ),
+    )
+    frames: list[Image.Image] = []
+    for i in range(max(len(x.frames) for x, _ in animated)):
+        patch = canvas.crop(box)
+        texts = [
+            (it.frames[i % len(it.frames)], (x - box[0], y - box[1]))
+            for it, (x, y) in animated
+        ]
+        patch.alpha_composite(paint_texts(patch.size, texts))
+        frames.append(patch)
+
+    first = canvas.copy()
+    first.paste(frames[0], box[:2])
+    return first, frames[1:], box[:2]
+
+
+def build_img(
+    header1: str,
+    header2: str,
+    icon: BuildImage | None = None,
+    extra: ImageType | str | None = None,
+) -> BytesIO:
+    canvas = build_canvas(header1, header2, icon, extra)
+    animated = (
+        [
+            (it, pos)
+            for it, pos in iter_placements(extra, EXTRA_POS)
+            if isinstance(it, AnimatedText)
+        ]
+        if isinstance(extra, (ImageGrid, ImageColumns))
+        else []
+    )
+    if not animated:
+        with timer("encode"):
+            return encode_image(canvas.image)
+
+    first, patches, offset = draw_animation_frames(canvas.image, animated)
+    with timer("encode"):
+        return encode_animation(first, patches, offset)
+
+
+# 开启 MCSTAT_ANIMATE_OBFUSCATED 时，含有乱码的行画成每帧随机字符都不同的动画
+def draw_motd(motd: "Motd") -> list[ImageType | str]:
+    lines: list[ImageType | str] = []
+    for line in motd_bbcode_placeholders(motd):
+        if config.animate_obfuscated and "[obfuscated]" in line:
+            frames = [
+                ex_default_style(fill_obfuscated(line))
+                for _ in range(max(config.animation_frames, 1))
+            ]
+            lines.append(AnimatedText(frames))
+        else:
+            lines.append(fill_obfuscated(line))
+    return lines
+
+
+def get_command_prefix() -> str:
     cmd_prefix_li = list(get_driver().config.command_start)
-    prefix = cmd_prefix_li[0] if cmd_prefix_li else ""
+    return cmd_prefix_li[0] if cmd_prefix_li else ""
+
+
+def draw_help(svr_type: ServerType) -> BytesIO:
+    prefix = get_command_prefix()
 
     extra_txt = [
         f"查询Java版服务器: {prefix}motdje <服务器IP>",
@@ -292,19 +854,32 @@ def draw_help(svr_type: ServerType) -> BytesIO:
     ]
     if config.enable_auto_detect:
         extra_txt.append(f"自动检测服务器类型: {prefix}motd <服务器IP>")
+    extra_txt.append(f"批量查询服务器: {prefix}motdbatch <服务器组名/服务器IP...>")
     extra = ImageGrid()
     for x in extra_txt:
         extra.append_line(x)
     return build_img(get_header_by_svr_type(svr_type), "使用帮助", extra=extra)
 
 
-def draw_java(res: JavaStatusResponse, addr: str) -> BytesIO:
-    transformer = BBCodeTransformer(bedrock=res.motd.bedrock)
+def draw_latency(latency: LatencyStats) -> Text2Image:
+    text = f"{latency.median:.2f}ms"
+    if len(latency.samples) > 1:
+        text += (
+            f"[stroke={STROKE_COLOR['7']}][color={CODE_COLOR['7']}]"
+            f" (最低 {latency.min:.2f}ms / 抖动 {latency.jitter:.2f}ms)"
+            "[/color][/stroke]"
+        )
+    return ex_default_style(text, get_latency_color(latency.median))
+
+
+def draw_java(
+    res: JavaStatusResponse,
+    addr: str,
+    latency: LatencyStats | None = None,
+) -> BytesIO:
     # there're no line spacing in Text2Image since pil-utils 0.2.0
     # so we split lines there then manually add the space
-    motd = [
-        transformer.transform(x) for x in split_motd_lines(trim_motd(res.motd.parsed))
-    ]
+    motd = draw_motd(res.motd)
     online_percent = (
         f"{res.players.online / res.players.max * 100:.2f}"
         if res.players.max
@@ -319,7 +894,7 @@ def draw_java(res: JavaStatusResponse, addr: str) -> BytesIO:
         if tmp := (mod_info.get("mods") or mod_info.get("modList")):
             mod_list = format_mod_list(tmp)
 
-    l_style = partial(ex_default_style, color_code="7")
+    l_style = partial(ex_default_style, color_code="7", cache=True)
     grid = ImageGrid(align_items=False)
     for line in motd:
         grid.append_line(line)
@@ -337,49 +912,42 @@ def draw_java(res: JavaStatusResponse, addr: str) -> BytesIO:
         grid.append_line(l_style("Mod 总数: "), str(len(mod_list)))
     grid.append_line(
         l_style("聊天签名: "),
-        "必需" if res.enforces_secure_chat else "无需",
+        const_style("必需" if res.enforces_secure_chat else "无需"),
     )
     if config.show_delay:
         grid.append_line(
             l_style("测试延迟: "),
-            ex_default_style(f"{res.latency:.2f}ms", get_latency_color(res.latency)),
+            draw_latency(latency or LatencyStats((res.latency,))),
         )
     if mod_list and config.show_mods:
         grid.append_line(
             l_style("Mod 列表: "),
-            ImageGrid.from_list(mod_list),
+            layout_mod_list(mod_list),
         )
     if res.players.sample:
         grid.append_line(
             l_style("玩家列表: "),
             ImageGrid.from_list(
-                [
-                    transformer.transform(Motd.parse(x.name).parsed)
-                    for x in res.players.sample
-                ],
+                [name_to_bbcode(x.name, res.motd.bedrock) for x in res.players.sample],
             ),
         )
 
-    icon = (
-        BuildImage.open(BytesIO(base64.b64decode(res.icon.split(",")[-1])))
-        if res.icon
-        else None
-    )
-    return build_img(JE_HEADER, SUCCESS_TITLE, icon=icon, extra=grid)
+    return build_img(JE_HEADER, SUCCESS_TITLE, icon=get_icon(res.icon), extra=grid)
 
 
-def draw_bedrock(res: "BedrockStatusResponse", addr: str) -> BytesIO:
-    transformer = BBCodeTransformer(bedrock=res.motd.bedrock)
-    motd = (
-        transformer.transform(x) for x in split_motd_lines(trim_motd(res.motd.parsed))
-    )
+def draw_bedrock(
+    res: "BedrockStatusResponse",
+    addr: str,
+    latency: LatencyStats | None = None,
+) -> BytesIO:
+    motd = draw_motd(res.motd)
     online_percent = (
         f"{int(res.players.online) / int(res.players.max) * 100:.2f}"
         if res.players.max
         else "?.??"
     )
 
-    l_style = partial(ex_default_style, color_code="7")
+    l_style = partial(ex_default_style, color_code="7", cache=True)
     grid = ImageGrid(align_items=False)
     for line in motd:
         grid.append_line(line)
@@ -396,12 +964,12 @@ def draw_bedrock(res: "BedrockStatusResponse", addr: str) -> BytesIO:
     if res.gamemode:
         grid.append_line(
             l_style("游戏模式: "),
-            GAME_MODE_MAP.get(res.gamemode, res.gamemode),
+            const_style(GAME_MODE_MAP.get(res.gamemode, res.gamemode)),
         )
     if config.show_delay:
         grid.append_line(
             l_style("测试延迟: "),
-            ex_default_style(f"{res.latency:.2f}ms", get_latency_color(res.latency)),
+            draw_latency(latency or LatencyStats((res.latency,))),
         )
 
     return build_img(BE_HEADER, SUCCESS_TITLE, extra=grid)
@@ -412,6 +980,12 @@ def parse_error(e: Exception) -> tuple[str, str]:
         return "请求超时", ""
     if isinstance(e, socket.gaierror):
         return "域名解析失败", str(e)
+    if isinstance(e, CanvasTooLargeError):
+        return "图片过大", f"图片尺寸 {e} 超出了限制"
+    if isinstance(e, QueueFullError):
+        return "排队的请求过多", ""
+    if isinstance(e, AutoDetectError):
+        return "所有尝试皆出错", ""
     return DEFAULT_ERR_TITLE, f"{e.__class__.__name__}: {e}"
 
 
@@ -419,11 +993,10 @@ def join_strings(*s: str, sp: str = "：") -> str:
     return sp.join(x for x in s if x)
 
 
-def draw_error(
-    svr_type: ServerType,
+def get_error_extras(
     *e: Exception | tuple[str, Exception],
     title: str | None = None,
-) -> BytesIO:
+) -> tuple[str, list[str] | None]:
     if len(e) == 1 and (not title):
         title, extra = (
             (x[0], join_strings(*parse_error(x[1])))
@@ -440,11 +1013,23 @@ def draw_error(
             )
             for x in e
         ]
-    if not title:
-        title = DEFAULT_ERR_TITLE
+    return title or DEFAULT_ERR_TITLE, extras
+
+
+def is_fixed_error(*e: Exception | tuple[str, Exception]) -> bool:
+    return not any(parse_error(x[1] if isinstance(x, tuple) else x)[1] for x in e)
+
+
+def draw_error_card(
+    svr_type: ServerType,
+    title: str,
+    extras: Sequence[str] | None = None,
+) -> BytesIO:
     if extras:
         lines = [
-            ImageLine(ex_default_style(x).wrap((MIN_WIDTH * 1.5) - MARGIN * 2))
+            ImageLine(
+                ex_default_style(x).wrap((MIN_WIDTH * 1.5) - MARGIN * 2),
+            )
             for x in extras
         ]
         extra_img = ImageGrid(*lines)
@@ -453,56 +1038,314 @@ def draw_error(
     return build_img(get_header_by_svr_type(svr_type), title, extra=extra_img)
 
 
-def draw_resp(
-    resp: Union[JavaStatusResponse, "BedrockStatusResponse"],
-    addr: str,
+def draw_error(
+    svr_type: ServerType,
+    *e: Exception | tuple[str, Exception],
+    title: str | None = None,
 ) -> BytesIO:
+    return draw_error_card(svr_type, *get_error_extras(*e, title=title))
+
+
+def draw_stats(stages: list[StageSnapshot], caches: list[CacheSnapshot]) -> BytesIO:
+    l_style = partial(ex_default_style, color_code="7")
+    grid = ImageGrid()
+    for x in stages:
+        if not (x.count or x.errors):
+            continue
+        text = f"P50 {x.p50:.2f}ms / P95 {x.p95:.2f}ms / P99 {x.p99:.2f}ms"
+        text += f" ({x.count} 次"
+        if x.errors:
+            text += f"，失败 {x.errors} 次"
+        grid.append_line(l_style(f"{STAGES[x.name]}: "), f"{text})")
+    for x in caches:
+        if not x.hits + x.misses:
+            continue
+        text = f"{x.hit_rate:.2%} (命中 {x.hits} / 未命中 {x.misses}，{x.size} 条"
+        if x.saved_time:
+            text += f"，约节省 {x.saved_time * 1000:.1f}ms"
+        grid.append_line(l_style(f"{x.title}缓存: "), f"{text})")
+    if not grid:
+        grid.append_line("暂无数据")
+
+    total = next((x.count for x in stages if x.name == "total"), 0)
+    return build_img(STATS_HEADER, f"共处理 {total} 次请求", extra=grid)
+
+
+@dataclass(frozen=True)
+class BatchRow:
+    addr: str
+    status: ServerStatus | None = None
+    # 查询出错时的说明，异常对象不一定能被 pickle，所以先转成字符串
+    error: str | None = None
+
+
+def draw_batch_row(row: BatchRow) -> ImageLine:
+    status = row.status
+    if status is None:
+        icon = get_icon(None)
+    else:
+        icon = get_icon(
+            status.resp.icon if isinstance(status.resp, JavaStatusResponse) else None,
+        )
+    icon = icon.resize((BATCH_ICON_SIZE, BATCH_ICON_SIZE), Resampling.NEAREST)
+
+    info = ImageGrid(spacing=BATCH_ROW_SPACING, align_items=False)
+    if status is None:
+        info.append_line(row.addr)
+        info.append_line(ex_default_style(row.error or DEFAULT_ERR_TITLE, "c"))
+        return ImageLine(icon, info)
+
+    resp = status.resp
+    stats = f"{resp.players.online}/{resp.players.max}"
+    if config.show_delay:
+        code = get_latency_color(status.latency.median)
+        stats += (
+            f" [stroke={STROKE_COLOR[code]}][color={CODE_COLOR[code]}]"
+            f"{status.latency.median:.2f}ms[/color][/stroke]"
+        )
+    info.append_line(row.addr, ex_default_style(stats, "7"))
+    if motd := draw_motd(resp.motd):
+        info.append_line(motd[0])
+    return ImageLine(icon, info)
+
+
+def draw_batch_rows(title: str, rows: Sequence[BatchRow]) -> BytesIO:
+    with timer("render"):
+        grid = ImageGrid(*(draw_batch_row(x) for x in rows))
+        return build_img(BATCH_HEADER, title, extra=grid)
+
+
+# 内容只取决于参数与配置的图片（使用帮助、错误卡片等），渲染一次后直接返回编码好的图片
+# 相关配置变化时清空
+class StaticAssets:
+    def __init__(self, maxbytes: int) -> None:
+        self.cache: SizedLRUCache[tuple[Any, ...], bytes] = SizedLRUCache(maxbytes)
+        self.flight: SingleFlight[tuple[Any, ...], bytes] = SingleFlight()
+        self.config_key: tuple[Any, ...] | None = None
+
+    def check_config(self) -> None:
+        key = (get_command_prefix(), config.enable_auto_detect, tuple(config.font))
+        if key != self.config_key:
+            self.cache.clear()
+            self.config_key = key
+
+    async def get(self, func: Callable[..., BytesIO], *args: Hashable) -> BytesIO:
+        self.check_config()
+        key = (func.__name__, *args)
+        if (data := self.cache.get(key)) is not None:
+            return BytesIO(data)
+
+        async def render() -> bytes:
+            data = (await run_render(func, *args)).getvalue()
+            self.cache.set(key, data)
+            return data
+
+        return BytesIO(await self.flight.do(key, render))
+
+    async def prerender(self) -> None:
+        svr_types: tuple[ServerType, ...] = ("je", "be", "auto")
+        for svr_type in svr_types:
+            await self.get(draw_help, svr_type)
+        title, extras = get_error_extras(TimeoutError())
+        for svr_type in svr_types:
+            await self.get(draw_error_card, svr_type, title, extras)
+        logger.debug(f"Prerendered {len(self.cache)} static images")
+
+
+static_assets = StaticAssets(STATIC_CACHE_SIZE)
+register_cache("static", "静态图片", static_assets.cache)
+
+
+async def render_error(
+    svr_type: ServerType,
+    *e: Exception | tuple[str, Exception],
+    title: str | None = None,
+) -> BytesIO:
+    # 异常对象不一定能被 pickle，先在事件循环里转成字符串
+    title, extras = get_error_extras(*e, title=title)
+    extras_key = tuple(extras) if extras else None
+    # 只缓存文字固定的卡片，带有具体异常信息的每次都不一样，缓存只会挤掉常用的图片
+    if is_fixed_error(*e):
+        return await static_assets.get(draw_error_card, svr_type, title, extras_key)
+    return await run_render(draw_error_card, svr_type, title, extras_key)
+
+
+def draw_resp(status: ServerStatus, addr: str) -> BytesIO:
+    with timer("render"):
+        if isinstance(resp := status.resp, JavaStatusResponse):
+            return draw_java(resp, addr, status.latency)
+        return draw_bedrock(resp, addr, status.latency)
+
+
+def get_icon_digest(icon: str | None) -> str | None:
+    return hashlib.sha1(icon.encode()).hexdigest() if icon else None
+
+
+def get_latency_bucket(latency: float) -> float:
+    step = config.image_cache_latency_bucket
+    return round(latency / step) if step > 0 else latency
+
+
+# 只包含会被画到图上的字段，相同指纹的状态画出来的图是一样的
+def get_resp_fingerprint(status: ServerStatus, addr: str) -> str:
+    resp, latency = status.resp, status.latency
     if isinstance(resp, JavaStatusResponse):
-        return draw_java(resp, addr)
-    return draw_bedrock(resp, addr)
+        fields: list[Any] = [
+            "je",
+            resp.motd.raw,
+            resp.version.name,
+            resp.version.protocol,
+            resp.players.online,
+            resp.players.max,
+            [x.name for x in resp.players.sample or ()],
+            get_icon_digest(resp.icon),
+            resp.raw.get("modinfo"),
+            resp.enforces_secure_chat,
+        ]
+    else:
+        fields = [
+            "be",
+            resp.motd.raw,
+            resp.version.protocol,
+            resp.version.version,
+            resp.players.online,
+            resp.players.max,
+            resp.map_name,
+            resp.gamemode,
+        ]
+    fields.extend(
+        (
+            (
+                [
+                    get_latency_bucket(x)
+                    for x in (latency.median, latency.min, latency.jitter)
+                ]
+                if config.show_delay
+                else None
+            ),
+            addr if config.show_addr else None,
+            config.show_mods,
+            config.font,
+        ),
+    )
+    dumped = json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(dumped.encode()).hexdigest()
 
 
-async def draw(ip: str, svr_type: ServerType) -> BytesIO:
-    async def _inner(t: ServerTypeRaw) -> BytesIO:
-        is_java = t == "je"
-        host, port = await resolve_ip(ip, is_java)
+async def render_resp(status: ServerStatus, addr: str) -> BytesIO:
+    if not image_cache.enabled:
+        return await run_render(draw_resp, status, addr)
 
-        svr = JavaServer(host, port) if is_java else BedrockServer(host, port)
-        kw = {"version": config.java_protocol_version} if is_java else {}
-        if config.query_twice:
-            await svr.async_status(**kw)  # 第一次延迟通常不准
-        resp = await svr.async_status(**kw)
-        return draw_resp(resp, ip)
+    key = get_resp_fingerprint(status, addr)
+    if (data := image_cache.get(key)) is not None:
+        logger.debug(f"Image cache hit for {addr} ({image_cache.stats})")
+        return BytesIO(data)
 
-    try:
-        if not ip:
-            return draw_help(svr_type)
+    async def render() -> bytes:
+        data = (await run_render(draw_resp, status, addr)).getvalue()
+        image_cache.set(key, data)
+        return data
 
-        if svr_type != "auto":
-            return await _inner(svr_type)
+    return BytesIO(await image_flight.do(key, render))
+
+
+# 查询并画出服务器状态图，任何失败都会抛出异常，成功的结果会记下来供排队已满时返回
+async def draw_status(ip: str, svr_type: ServerType) -> BytesIO:
+    if svr_type != "auto":
+        status = await query_status(ip, svr_type)
+    else:
+        status = await query_status_auto(ip)
+    img = await render_resp(status, ip)
+    stale_cache.set((normalize_address(ip), svr_type), img.getvalue())
+    return img
 
-        # auto
+
+# draw_status 失败时的处理：排队已满时返回过时的结果，没有则继续抛出 QueueFullError，
+# 其他错误画成错误图片
+async def draw_failure(ip: str, svr_type: ServerType, e: Exception) -> BytesIO:
+    try:
+        if isinstance(e, QueueFullError):
+            raise e
+        if isinstance(e, AutoDetectError):
+            return await render_error(
+                svr_type,
+                *((t.upper(), x) for t, x in e.errors.items()),
+                title="所有尝试皆出错",
+            )
+        logger.opt(exception=e).error("获取服务器状态/画服务器状态图出错")
         try:
-            return await _inner("je")
-        except Exception as e:
-            logger.exception("获取JE服务器状态/画服务器状态图出错")
-            je_exc = e
+            return await render_error(svr_type, e)
+        except QueueFullError:
+            raise
+        except Exception:
+            logger.exception("画异常状态图失败")
+            raise
+
+    except QueueFullError:
+        if (data := stale_cache.get((normalize_address(ip), svr_type))) is None:
+            logger.warning(f"排队的请求过多，已拒绝查询 {ip}")
+            raise
+        logger.warning(f"排队的请求过多，返回 {ip} 过时的查询结果")
+        return BytesIO(data)
+
+
+# group 为请求来源（群、私聊等），排队时不同来源的请求轮流处理
+# 排队已满且没有可用的过时结果时抛出 QueueFullError
+async def draw(ip: str, svr_type: ServerType, group: Hashable = None) -> BytesIO:
+    with timer("total"), group_context(group):
+        if not ip:
+            return await static_assets.get(draw_help, svr_type)
         try:
-            return await _inner("be")
+            return await draw_status(ip, svr_type)
         except Exception as e:
-            logger.exception("获取BE服务器状态/画服务器状态图出错")
-            be_exc = e
-        return draw_error(
-            svr_type,
-            ("JE", je_exc),
-            ("BE", be_exc),
-            title="所有尝试皆出错",
-        )
+            return await draw_failure(ip, svr_type, e)
+
 
+async def query_batch_row(ip: str, svr_type: ServerType) -> BatchRow:
+    try:
+        if svr_type != "auto":
+            status = await query_status(ip, svr_type)
+        else:
+            status = await query_status_auto(ip)
     except Exception as e:
-        logger.exception("获取服务器状态/画服务器状态图出错")
+        logger.debug(f"Batch query of {ip} failed: {e!r}")
+        return BatchRow(ip, error=join_strings(*parse_error(e)))
+    return BatchRow(ip, status)
+
+
+# 同时查询多个服务器，画到一张图里，每个服务器一行
+# 单个服务器出错时只在对应的行显示错误，同时查询的数量不超过 MCSTAT_BATCH_CONCURRENCY
+async def draw_batch(
+    servers: Sequence[tuple[str, ServerType]],
+    title: str | None = None,
+    group: Hashable = None,
+) -> BytesIO:
+    with timer("total"), group_context(group):
+        semaphore = asyncio.Semaphore(max(config.batch_concurrency, 1))
+
+        async def query(ip: str, svr_type: ServerType) -> BatchRow:
+            async with semaphore:
+                return await query_batch_row(ip, svr_type)
+
+        rows = await asyncio.gather(*(query(*x) for x in servers))
+        online = sum(x.status is not None for x in rows)
+        if not title:
+            title = f"{online}/{len(rows)} 个服务器在线"
+        else:
+            title = f"{title} ({online}/{len(rows)} 在线)"
         try:
-            return draw_error(svr_type, e)
+            return await run_render(draw_batch_rows, title, rows)
+        except QueueFullError:
+            raise
         except Exception:
-            logger.exception("画异常状态图失败")
+            logger.exception("画服务器列表图出错")
             raise
+
+
+# 预先排版固定文字并渲染静态图片，省掉第一次查询时的这部分耗时
+async def warmup():
+    start = time.perf_counter()
+    await asyncio.to_thread(prewarm_fonts)
+    await asyncio.to_thread(prewarm_text_cache)
+    await static_assets.prerender()
+    logger.debug(f"Warmed up in {(time.perf_counter() - start) * 1000:.2f}ms")
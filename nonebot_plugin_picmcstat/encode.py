@@ -0,0 +1,215 @@
+import struct
+from collections.abc import Iterator
+from io import SEEK_END, BytesIO
+from typing import Literal, TypeAlias
+
+from nonebot import logger
+from PIL import GifImagePlugin, Image
+
+from .config import config
+
+ImageFormat: TypeAlias = Literal["jpeg", "png", "webp"]
+AnimationFormat: TypeAlias = Literal["gif", "webp"]
+
+MIN_QUALITY = 10
+# 动图的每一帧都要单独编码，使用 libwebp 最快的压缩方式，图片会稍大一些
+ANIMATION_WEBP_METHOD = 0
+PNG_COLOR_STEPS = (256, 128, 64, 32, 16)
+
+
+def save_image(
+    img: Image.Image,
+    fmt: ImageFormat,
+    quality: int | None = None,
+    png_colors: int = 0,
+) -> BytesIO:
+    output = BytesIO()
+    if fmt == "png":
+        if png_colors:
+            img = img.quantize(png_colors, method=Image.Quantize.FASTOCTREE)
+        img.save(output, "png")
+    else:
+        params = {} if quality is None else {"quality": quality}
+        img.save(output, fmt, **params)
+    return output
+
+
+def encode_image(
+    img: Image.Image,
+    fmt: ImageFormat | None = None,
+    quality: int | None = None,
+    png_colors: int | None = None,
+    max_bytes: int | None = None,
+) -> BytesIO:
+    fmt = fmt or config.image_format
+    quality = config.image_quality if quality is None else quality
+    png_colors = config.image_png_colors if png_colors is None else png_colors
+    max_bytes = config.image_max_bytes if max_bytes is None else max_bytes
+    img = img.convert("RGB")
+
+    output = save_image(img, fmt, quality, png_colors)
+    if (not max_bytes) or len(output.getbuffer()) <= max_bytes:
+        return output
+
+    best = output
+    if fmt == "png":
+        # 逐步减少调色板颜色数
+        for colors in PNG_COLOR_STEPS:
+            if png_colors and colors >= png_colors:
+                continue
+            best = save_image(img, fmt, png_colors=colors)
+            if len(best.getbuffer()) <= max_bytes:
+                return best
+    else:
+        # 二分查找不超过大小限制的最高质量
+        low, high = MIN_QUALITY, (quality or 75) - 1
+        while low <= high:
+            mid = (low + high) // 2
+            tmp = save_image(img, fmt, mid)
+            if len(tmp.getbuffer()) <= max_bytes:
+                best = tmp
+                low = mid + 1
+            else:
+                high = mid - 1
+                if len(tmp.getbuffer()) < len(best.getbuffer()):
+                    best = tmp
+        if len(best.getbuffer()) <= max_bytes:
+            return best
+
+    logger.warning(
+        f"Encoded image ({len(best.getbuffer())} bytes) "
+        f"still exceeds image_max_bytes ({max_bytes} bytes)",
+    )
+    return best
+
+
+# RIFF 块：类型、长度、内容，内容长度为奇数时补一个字节
+def riff_chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack("<I", len(data)) + data + b"\0" * (len(data) % 2)
+
+
+def iter_riff_chunks(data: bytes) -> Iterator[tuple[bytes, bytes]]:
+    pos = 0
+    while pos + 8 <= len(data):
+        fourcc = data[pos : pos + 4]
+        (size,) = struct.unpack("<I", data[pos + 4 : pos + 8])
+        yield fourcc, data[pos + 8 : pos + 8 + size]
+        pos += 8 + size + size % 2
+
+
+def u24(value: int) -> bytes:
+    return value.to_bytes(3, "little")
+
+
+# 单独编码一帧，包成 ANMF 块，不与上一帧混合，直接覆盖这块区域
+def encode_webp_frame(
+    img: Image.Image,
+    pos: tuple[int, int],
+    duration: int,
+    params: dict,
+) -> bytes:
+    output = BytesIO()
+    img.save(output, "webp", **params)
+    # 只保留图像数据（VP8 / VP8L / ALPH），去掉 RIFF 头和 VP8X 等块
+    data = b"".join(
+        riff_chunk(fourcc, chunk)
+        for fourcc, chunk in iter_riff_chunks(output.getvalue()[12:])
+        if fourcc in (b"VP8 ", b"VP8L", b"ALPH")
+    )
+    header = (
+        u24(pos[0] // 2)
+        + u24(pos[1] // 2)
+        + u24(img.width - 1)
+        + u24(img.height - 1)
+        + u24(duration)
+        + b"\x02"
+    )
+    return riff_chunk(b"ANMF", header + data)
+
+
+def encode_webp_animation(
+    first: Image.Image,
+    patches: list[Image.Image],
+    offset: tuple[int, int],
+    duration: int,
+    quality: int | None,
+) -> BytesIO:
+    params: dict = {"method": ANIMATION_WEBP_METHOD}
+    if quality is not None:
+        params["quality"] = quality
+    # WebP 的帧坐标只能是偶数，往左上扩展一个像素，扩出来的部分每一帧都相同
+    x, y = offset
+    if x % 2 or y % 2:
+        box = (x - x % 2, y - y % 2)
+        padded = []
+        for patch in patches:
+            tmp = first.crop((*box, x + patch.width, y + patch.height))
+            tmp.paste(patch, (x - box[0], y - box[1]))
+            padded.append(tmp)
+        patches, offset = padded, box
+
+    frames = [encode_webp_frame(first, (0, 0), duration, params)]
+    frames.extend(encode_webp_frame(x, offset, duration, params) for x in patches)
+    # VP8X 中只设置动图的标志位，之后是画布大小
+    canvas_size = u24(first.width - 1) + u24(first.height - 1)
+    body = (
+        b"WEBP"
+        + riff_chunk(b"VP8X", b"\x02\0\0\0" + canvas_size)
+        # 背景色与循环次数（0 为无限循环）
+        + riff_chunk(b"ANIM", b"\0\0\0\0" + struct.pack("<H", 0))
+        + b"".join(frames)
+    )
+    return BytesIO(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def encode_gif_animation(
+    first: Image.Image,
+    patches: list[Image.Image],
+    offset: tuple[int, int],
+    duration: int,
+) -> BytesIO:
+    # 所有帧都使用第一帧的调色板，之后的帧只量化变化的区域
+    first = first.quantize(256, method=Image.Quantize.FASTOCTREE)
+    output = BytesIO()
+    first.save(output, "gif", optimize=False, loop=0, duration=duration)
+    # 去掉结尾的 trailer，接着写入之后的帧
+    output.seek(-1, SEEK_END)
+    output.truncate()
+    for patch in patches:
+        patch = patch.quantize(palette=first, dither=Image.Dither.NONE)
+        for chunk in GifImagePlugin.getdata(patch, offset, duration=duration):
+            output.write(chunk)
+    output.write(b";")
+    return output
+
+
+# 第一帧是完整的图片，之后的每一帧只有 offset 处的同一块区域不同，
+# 只把这块区域编码成子帧，不需要让编码器逐帧对比整张图片
+def encode_animation(
+    first: Image.Image,
+    patches: list[Image.Image],
+    offset: tuple[int, int],
+    duration: int | None = None,
+    fmt: AnimationFormat | None = None,
+    quality: int | None = None,
+    max_bytes: int | None = None,
+) -> BytesIO:
+    fmt = fmt or config.animation_format
+    duration = config.animation_frame_time if duration is None else duration
+    quality = config.image_quality if quality is None else quality
+    max_bytes = config.image_max_bytes if max_bytes is None else max_bytes
+    first = first.convert("RGB")
+    patches = [x.convert("RGB") for x in patches]
+
+    if fmt == "gif":
+        output = encode_gif_animation(first, patches, offset, duration)
+    else:
+        output = encode_webp_animation(first, patches, offset, duration, quality)
+    if max_bytes and len(output.getbuffer()) > max_bytes:
+        # 动图超出大小限制时退回静态图片
+        logger.debug(
+            f"Animation ({len(output.getbuffer())} bytes) exceeds image_max_bytes, "
+            "falling back to a still image",
+        )
+        return encode_image(first)
+    return output
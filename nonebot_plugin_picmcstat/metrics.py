@@ -0,0 +1,245 @@
+import statistics
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import ParamSpec, Protocol, TypeAlias, TypeVar
+
+from nonebot import get_driver, logger
+from nonebot.drivers import URL, ASGIMixin, HTTPServerSetup, Request, Response
+
+from .cache import CacheStats
+from .config import config
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+Timings: TypeAlias = list[tuple[str, float, bool]]
+
+# 各阶段的名称与在统计图中显示的名字，按一次请求中的先后顺序排列
+STAGES = {
+    "queue": "排队等待",
+    "srv": "SRV 解析",
+    "host": "域名解析",
+    "status": "获取状态",
+    "ping": "测试延迟",
+    "render": "渲染（含编码）",
+    "encode": "编码图片",
+    "total": "总耗时",
+}
+# Prometheus 直方图的桶（秒）
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+# 计算分位数时使用最近多少次的耗时
+RECENT_SAMPLES = 1024
+
+
+class HasStats(Protocol):
+    stats: CacheStats
+
+    def __len__(self) -> int: ...
+
+
+@dataclass(frozen=True)
+class StageSnapshot:
+    name: str
+    count: int
+    errors: int
+    p50: float
+    p95: float
+    p99: float
+
+
+@dataclass(frozen=True)
+class CacheSnapshot:
+    name: str
+    title: str
+    size: int
+    hits: int
+    misses: int
+    hit_rate: float
+    saved_time: float  # 估算命中缓存节省的时间（秒），不统计生成耗时的缓存为 0
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.recent: deque[float] = deque(maxlen=RECENT_SAMPLES)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, success: bool = True) -> None:
+        with self._lock:
+            if not success:
+                self.errors += 1
+                return
+            self.buckets[bisect_left(BUCKETS, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def percentiles(self) -> tuple[float, float, float]:
+        with self._lock:
+            samples = list(self.recent)
+        if not samples:
+            return (0.0, 0.0, 0.0)
+        if len(samples) == 1:
+            return (samples[0],) * 3
+        q = statistics.quantiles(samples, n=100, method="inclusive")
+        return q[49], q[94], q[98]
+
+
+histograms: dict[str, Histogram] = {k: Histogram() for k in STAGES}
+# 名称 -> (显示的名字, 缓存)
+caches: dict[str, tuple[str, HasStats]] = {}
+# 渲染进程/线程中记录的耗时先存到这里，由 collect_timings 带回主进程
+_collector: ContextVar[Timings | None] = ContextVar("_collector", default=None)
+
+
+def register_cache(name: str, title: str, cache: HasStats) -> None:
+    caches[name] = (title, cache)
+
+
+def record(stage: str, seconds: float, success: bool = True) -> None:
+    if (collector := _collector.get()) is not None:
+        collector.append((stage, seconds, success))
+    else:
+        histograms[stage].observe(seconds, success)
+
+
+def record_many(timings: Timings) -> None:
+    for stage, seconds, success in timings:
+        histograms[stage].observe(seconds, success)
+
+
+# 出错时只计入错误次数，不计入耗时
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record(stage, time.perf_counter() - start, success=False)
+        raise
+    record(stage, time.perf_counter() - start)
+
+
+def collect_timings(
+    func: Callable[P, R],
+    *args: P.args,
+    **kwargs: P.kwargs,
+) -> tuple[R, Timings]:
+    timings: Timings = []
+    token = _collector.set(timings)
+    try:
+        return func(*args, **kwargs), timings
+    finally:
+        _collector.reset(token)
+
+
+def snapshot_stages() -> list[StageSnapshot]:
+    return [
+        StageSnapshot(
+            name,
+            hist.count,
+            hist.errors,
+            *(x * 1000 for x in hist.percentiles()),
+        )
+        for name, hist in histograms.items()
+    ]
+
+
+def snapshot_caches() -> list[CacheSnapshot]:
+    return [
+        CacheSnapshot(
+            name,
+            title,
+            len(cache),
+            cache.stats.hits,
+            cache.stats.misses,
+            cache.stats.hit_rate,
+            cache.stats.saved_time,
+        )
+        for name, (title, cache) in caches.items()
+    ]
+
+
+def format_prometheus() -> str:
+    lines = [
+        "# HELP picmcstat_stage_duration_seconds Time spent in each request stage",
+        "# TYPE picmcstat_stage_duration_seconds histogram",
+    ]
+    for stage, hist in histograms.items():
+        cumulative = 0
+        for le, count in zip((*BUCKETS, "+Inf"), hist.buckets):
+            cumulative += count
+            lines.append(
+                "picmcstat_stage_duration_seconds_bucket"
+                f'{{stage="{stage}",le="{le}"}} {cumulative}',
+            )
+        lines.append(
+            f'picmcstat_stage_duration_seconds_sum{{stage="{stage}"}} {hist.sum}',
+        )
+        lines.append(
+            f'picmcstat_stage_duration_seconds_count{{stage="{stage}"}} {hist.count}',
+        )
+
+    lines.append("# HELP picmcstat_stage_errors_total Failed attempts of each stage")
+    lines.append("# TYPE picmcstat_stage_errors_total counter")
+    lines.extend(
+        f'picmcstat_stage_errors_total{{stage="{stage}"}} {hist.errors}'
+        for stage, hist in histograms.items()
+    )
+
+    for metric, kind, getter in (
+        ("cache_hits_total", "counter", lambda x: x.stats.hits),
+        ("cache_misses_total", "counter", lambda x: x.stats.misses),
+        ("cache_entries", "gauge", len),
+        ("cache_saved_seconds", "gauge", lambda x: x.stats.saved_time),
+    ):
+        lines.append(f"# TYPE picmcstat_{metric} {kind}")
+        lines.extend(
+            f'picmcstat_{metric}{{cache="{name}"}} {getter(cache)}'
+            for name, (_, cache) in caches.items()
+        )
+    return "\n".join(lines) + "\n"
+
+
+def setup_metrics_route() -> None:
+    if not (path := config.metrics_path):
+        return
+    driver = get_driver()
+    if not isinstance(driver, ASGIMixin):
+        logger.warning("当前驱动器不支持 HTTP 服务端，无法导出 Prometheus 指标")
+        return
+
+    async def handle(_: Request) -> Response:
+        return Response(
+            200,
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+            content=format_prometheus(),
+        )
+
+    driver.setup_http_server(
+        HTTPServerSetup(URL(path), "GET", "picmcstat_metrics", handle),
+    )
+    logger.info(f"已在 {path} 导出 Prometheus 指标")
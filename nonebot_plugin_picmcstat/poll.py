@@ -0,0 +1,132 @@
+import asyncio
+import random
+import time
+from collections.abc import Hashable
+from dataclasses import dataclass
+
+from nonebot import logger
+
+from .cache import SingleFlight
+from .config import config
+from .const import ServerType
+from .schedule import QueueFullError, group_context
+
+# 轮询间隔的下限（秒），避免配置过小时频繁查询服务器
+POLL_MIN_INTERVAL = 10
+# 启动后第一次轮询的时间在这段时间内随机分布（秒），避免同时查询所有服务器
+POLL_START_SPREAD = 10
+# 后台轮询的请求算作同一组，排队时与用户的请求轮流处理
+POLL_GROUP = "poll"
+
+PollKey = tuple[str, ServerType]
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    image: bytes
+    time: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.time
+
+
+# 在后台定时查询配置了 poll_interval 的快捷指令的服务器并画好图，
+# 触发快捷指令时直接返回最近一次的结果，结果过时则在后台重新查询
+class ShortcutPoller:
+    def __init__(self) -> None:
+        self.snapshots: dict[PollKey, Snapshot] = {}
+        self.flight: SingleFlight[PollKey, bytes] = SingleFlight()
+        self._tasks: set[asyncio.Task] = set()
+        self._semaphore: asyncio.Semaphore | None = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(config.poll_concurrency, 1))
+        return self._semaphore
+
+    # 同一个服务器被多个快捷指令使用时只轮询一次，使用最短的间隔
+    @staticmethod
+    def get_intervals() -> dict[PollKey, float]:
+        intervals: dict[PollKey, float] = {}
+        for x in config.shortcuts:
+            if x.poll_interval <= 0:
+                continue
+            key = (x.host, x.type)
+            interval = max(x.poll_interval, POLL_MIN_INTERVAL)
+            intervals[key] = min(intervals.get(key, interval), interval)
+        return intervals
+
+    # 只有查询与渲染都成功时才更新结果，失败时抛出异常，保留上一次的结果
+    # 不使用 draw()，它在出错时会返回错误图片，排队已满时会返回过时的结果
+    async def refresh(self, key: PollKey, group: Hashable = POLL_GROUP) -> bytes:
+        # 渲染相关的模块导入较慢，第一次用到时再导入
+        from .draw import draw_status
+
+        async def do() -> bytes:
+            async with self.semaphore:
+                with group_context(group):
+                    data = (await draw_status(*key)).getvalue()
+            self.snapshots[key] = Snapshot(data, time.monotonic())
+            return data
+
+        return await self.flight.do(key, do)
+
+    async def _refresh_in_background(self, key: PollKey) -> None:
+        try:
+            await self.refresh(key)
+        except QueueFullError:
+            logger.debug(f"Skipped polling {key[0]} because the queue is full")
+        except Exception as e:
+            logger.warning(
+                f"后台查询 {key[0]} 失败，继续使用上一次的结果："
+                f"{e.__class__.__name__}: {e}",
+            )
+
+    def spawn(self, key: PollKey) -> None:
+        task = asyncio.create_task(self._refresh_in_background(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # 有结果时直接返回，结果过时则在后台重新查询；还没有结果时当场查询
+    async def get(self, key: PollKey, group: Hashable = None) -> bytes:
+        if (snapshot := self.snapshots.get(key)) is None:
+            try:
+                return await self.refresh(key, group)
+            except Exception as e:
+                # 还没有结果时与普通查询一样，出错时返回错误图片或过时的结果
+                from .draw import draw_failure
+
+                with group_context(group):
+                    return (await draw_failure(*key, e)).getvalue()
+        if snapshot.age > config.poll_fresh_ttl and key not in self.flight:
+            logger.debug(f"Snapshot of {key[0]} is {snapshot.age:.1f}s old, refreshing")
+            self.spawn(key)
+        return snapshot.image
+
+    async def poll(self, key: PollKey, interval: float) -> None:
+        await asyncio.sleep(random.uniform(0, min(interval, POLL_START_SPREAD)))
+        while True:
+            await self._refresh_in_background(key)
+            jitter = interval * config.poll_jitter
+            await asyncio.sleep(
+                max(interval + random.uniform(-jitter, jitter), POLL_MIN_INTERVAL),
+            )
+
+    def start(self) -> None:
+        for key, interval in self.get_intervals().items():
+            task = asyncio.create_task(self.poll(key, interval))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._tasks:
+            logger.info(f"已开始在后台轮询 {len(self._tasks)} 个快捷指令的服务器")
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+poller = ShortcutPoller()
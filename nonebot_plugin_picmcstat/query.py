@@ -0,0 +1,280 @@
+import asyncio
+import statistics
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, replace
+from time import perf_counter
+from typing import TYPE_CHECKING, TypeAlias, Union, cast
+
+import asyncio_dgram
+from mcstatus import BedrockServer, JavaServer
+from mcstatus.bedrock_status import BedrockServerStatus
+from mcstatus.pinger import AsyncServerPinger
+from mcstatus.protocol.connection import TCPAsyncSocketConnection
+from mcstatus.status_response import JavaStatusResponse
+from mcstatus.utils import retry
+from nonebot import logger
+
+from .cache import SingleFlight, TTLCache
+from .config import config
+from .const import ServerTypeRaw
+from .metrics import record, register_cache, timer
+from .schedule import QueueFullError, probe_limiter
+from .util import ResolveContext, normalize_address, resolve_ip
+
+if TYPE_CHECKING:
+    from mcstatus.responses import BedrockStatusResponse
+
+StatusResponse: TypeAlias = Union[JavaStatusResponse, "BedrockStatusResponse"]
+StatusKey: TypeAlias = tuple[str, ServerTypeRaw]
+
+AUTO_DETECT_ORDER: tuple[ServerTypeRaw, ...] = ("je", "be")
+# 获取状态之后的延迟采样都是可选的，每次只等获取状态耗时的这么多倍，
+# 不低于 PING_TIMEOUT_MIN（秒），也不超过查询的超时时间，超时就停止采样
+PING_TIMEOUT_FACTOR = 4
+PING_TIMEOUT_MIN = 0.25
+
+
+@dataclass(frozen=True)
+class LatencyStats:
+    samples: tuple[float, ...]
+
+    @property
+    def min(self) -> float:
+        return min(self.samples)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples)
+
+    @property
+    def jitter(self) -> float:
+        # 相邻两次采样之差的平均值
+        if len(self.samples) < 2:
+            return 0.0
+        return statistics.fmean(
+            abs(a - b) for a, b in zip(self.samples, self.samples[1:])
+        )
+
+
+@dataclass(frozen=True)
+class ServerStatus:
+    resp: StatusResponse
+    latency: LatencyStats
+
+
+status_cache: TTLCache[StatusKey, ServerStatus] = TTLCache(
+    config.status_cache_ttl,
+    config.status_cache_size,
+)
+status_flight: SingleFlight[StatusKey, ServerStatus] = SingleFlight()
+# 自动检测时记住每个地址对应的服务器类型
+edition_cache: TTLCache[str, ServerTypeRaw] = TTLCache(
+    config.auto_detect_memory_ttl,
+    1024,
+)
+register_cache("status", "服务器状态", status_cache)
+register_cache("edition", "自动检测类型", edition_cache)
+
+
+def get_ping_timeout(timeout: float, status_latency: float) -> float:
+    timeout_by_latency = status_latency / 1000 * PING_TIMEOUT_FACTOR
+    return min(timeout, max(timeout_by_latency, PING_TIMEOUT_MIN))
+
+
+class AutoDetectError(Exception):
+    def __init__(self, errors: dict[ServerTypeRaw, Exception]) -> None:
+        # 始终按 JE、BE 的顺序展示
+        self.errors = {t: errors[t] for t in AUTO_DETECT_ORDER if t in errors}
+        super().__init__(self.errors)
+
+
+@retry(tries=3)
+async def sample_java_status(
+    svr: JavaServer,
+    samples: int,
+) -> tuple[JavaStatusResponse, list[float]]:
+    # 在同一个连接上先获取状态，再发送多个 ping 包测延迟
+    async with AsyncExitStack() as stack:
+        with timer("status"):
+            connection = await stack.enter_async_context(
+                TCPAsyncSocketConnection(svr.address, svr.timeout),
+            )
+            pinger = AsyncServerPinger(
+                connection,
+                address=svr.address,
+                version=config.java_protocol_version,
+            )
+            pinger.handshake()
+            resp = await pinger.read_status()
+
+        ping_timeout = get_ping_timeout(svr.timeout, resp.latency)
+        latencies: list[float] = []
+        for _ in range(samples):
+            start = perf_counter()
+            try:
+                latencies.append(
+                    await asyncio.wait_for(pinger.test_ping(), ping_timeout),
+                )
+                record("ping", perf_counter() - start)
+            except Exception as e:
+                # 原版服务端回复一次 ping 后就会断开连接
+                logger.debug(
+                    f"Ping #{len(latencies) + 1} to {svr.address} failed: "
+                    f"{e.__class__.__name__}: {e}",
+                )
+                break
+
+    return resp, latencies or [resp.latency]
+
+
+@retry(tries=3)
+async def sample_bedrock_status(
+    svr: BedrockServer,
+    samples: int,
+) -> tuple["BedrockStatusResponse", list[float]]:
+    # 在同一个 UDP 套接字上先获取状态，再发送多个 Unconnected Ping 测延迟，
+    # 与 Java 版一样，获取状态的那一次不算作延迟采样
+    timeout = svr.timeout
+    stream = await asyncio.wait_for(asyncio_dgram.connect(svr.address), timeout)
+
+    async def exchange(timeout: float) -> bytes:
+        await asyncio.wait_for(
+            stream.send(BedrockServerStatus.request_status_data),
+            timeout,
+        )
+        data, _ = await asyncio.wait_for(stream.recv(), timeout)
+        return data
+
+    latencies: list[float] = []
+    try:
+        with timer("status"):
+            start = perf_counter()
+            data = await exchange(timeout)
+            status_latency = (perf_counter() - start) * 1000
+
+        ping_timeout = get_ping_timeout(timeout, status_latency)
+        for _ in range(samples):
+            start = perf_counter()
+            try:
+                await exchange(ping_timeout)
+            except Exception as e:
+                logger.debug(
+                    f"Ping #{len(latencies) + 1} to {svr.address} failed: "
+                    f"{e.__class__.__name__}: {e}",
+                )
+                break
+            elapsed = perf_counter() - start
+            record("ping", elapsed)
+            latencies.append(elapsed * 1000)
+    finally:
+        stream.close()
+
+    return (
+        BedrockServerStatus.parse_response(data, status_latency),
+        latencies or [status_latency],
+    )
+
+
+async def fetch_status(
+    ip: str,
+    svr_type: ServerTypeRaw,
+    ctx: ResolveContext | None = None,
+) -> ServerStatus:
+    is_java = svr_type == "je"
+    host, port = await resolve_ip(ip, is_java, ctx)
+
+    svr = JavaServer(host, port) if is_java else BedrockServer(host, port)
+    # 基岩版的每次采样都会收到完整的状态，采样次数单独配置
+    samples = config.latency_samples if is_java else config.bedrock_latency_samples
+    if samples > 0:
+        resp, latencies = await (
+            sample_java_status(svr, samples)
+            if isinstance(svr, JavaServer)
+            else sample_bedrock_status(svr, samples)
+        )
+        stats = LatencyStats(tuple(latencies))
+        return ServerStatus(replace(resp, latency=stats.median), stats)
+
+    kw = {"version": config.java_protocol_version} if is_java else {}
+    if config.query_twice:
+        with timer("status"):
+            await svr.async_status(**kw)  # 第一次延迟通常不准
+    with timer("status"):
+        resp = await svr.async_status(**kw)
+    return ServerStatus(resp, LatencyStats((resp.latency,)))
+
+
+async def query_status(
+    ip: str,
+    svr_type: ServerTypeRaw,
+    ctx: ResolveContext | None = None,
+) -> ServerStatus:
+    key = (normalize_address(ip), svr_type)
+    if (status := status_cache.get(key)) is not None:
+        logger.debug(f"Status cache hit for {key} ({status_cache.stats})")
+        return status
+
+    async def fetch() -> ServerStatus:
+        async with probe_limiter.slot():
+            status = await fetch_status(ip, svr_type, ctx)
+        status_cache.set(key, status)
+        return status
+
+    return await status_flight.do(key, fetch)
+
+
+async def query_status_auto(
+    ip: str,
+    ctx: ResolveContext | None = None,
+) -> ServerStatus:
+    ctx = ctx or ResolveContext()
+    key = normalize_address(ip)
+    errors: dict[ServerTypeRaw, Exception] = {}
+
+    if remembered := edition_cache.get(key):
+        other: ServerTypeRaw = "be" if remembered == "je" else "je"
+        for t in (remembered, other):
+            try:
+                status = await query_status(ip, t, ctx)
+            except QueueFullError:
+                raise
+            except Exception as e:
+                logger.opt(exception=e).error(f"获取{t.upper()}服务器状态出错")
+                errors[t] = e
+            else:
+                edition_cache.set(key, t)
+                return status
+        edition_cache.pop(key)
+        raise AutoDetectError(errors)
+
+    # 同时尝试两种协议，使用先成功的那个
+    # 其中一个因为排队已满被拒绝时，与其他出错一样继续等另一个的结果
+    tasks = {
+        asyncio.create_task(query_status(ip, t, ctx)): t for t in AUTO_DETECT_ORDER
+    }
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                t = tasks[task]
+                if isinstance(e := task.exception(), QueueFullError):
+                    logger.debug(f"{t.upper()} probe for {key} rejected, queue is full")
+                    errors[t] = e
+                    continue
+                if e is not None:
+                    logger.opt(exception=e).error(f"获取{t.upper()}服务器状态出错")
+                    errors[t] = cast("Exception", e)
+                    continue
+                edition_cache.set(key, t)
+                return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+    # 全部因为排队已满被拒绝时按排队已满处理
+    if all(isinstance(x, QueueFullError) for x in errors.values()):
+        raise next(iter(errors.values()))
+    raise AutoDetectError(errors)
@@ -0,0 +1,104 @@
+import asyncio
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import ParamSpec, TypeVar
+
+from nonebot import get_driver, logger
+
+from .config import config
+from .metrics import collect_timings, record_many
+from .schedule import render_limiter
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+_executor: Executor | None = None
+
+
+def create_executor() -> Executor | None:
+    backend = config.render_backend
+    if backend == "inline":
+        return None
+
+    if backend == "process":
+        # worker 需要继承已初始化的 NoneBot 与插件配置，所以只能用 fork
+        if "fork" in multiprocessing.get_all_start_methods():
+            return ProcessPoolExecutor(
+                max_workers=config.render_workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=init_worker,
+            )
+        logger.warning("当前平台不支持以 fork 方式创建进程，渲染后端将回退为线程池")
+
+    return ThreadPoolExecutor(
+        max_workers=config.render_workers,
+        thread_name_prefix="picmcstat-render",
+    )
+
+
+# 在子进程中导入渲染模块并排版固定文字，省掉每个子进程第一次渲染时的这部分耗时
+# 这里出错会让整个进程池不可用，所以不抛出异常
+def init_worker() -> None:
+    if not config.warmup:
+        return
+    try:
+        from .draw import prewarm_text_cache
+
+        prewarm_text_cache()
+    except Exception:
+        logger.exception("渲染进程预热失败")
+
+
+# 进程池默认在第一次渲染时才 fork，那时进程里已经有 to_thread 的线程、预热任务等，
+# 在多线程的进程中 fork 可能让子进程卡死在别的线程持有的锁上（如日志的锁），
+# 所以在启动时、其他线程创建之前就创建好进程池并 fork 出全部子进程
+def start_render_pool() -> None:
+    if config.render_backend != "process":
+        return
+    executor = get_executor()
+    if not isinstance(executor, ProcessPoolExecutor):
+        return
+    if (count := threading.active_count()) > 1:
+        logger.warning(
+            f"创建渲染进程池时已有 {count - 1} 个其他线程在运行，"
+            "以 fork 方式创建的子进程有可能卡死，"
+            "如遇到此问题请将 MCSTAT_RENDER_BACKEND 改为 thread",
+        )
+    # 以 fork 方式创建时，第一次提交任务就会创建全部子进程
+    executor.submit(int)
+    logger.debug("Forked render processes")
+
+
+def get_executor() -> Executor | None:
+    global _executor
+    if (_executor is None) and (config.render_backend != "inline"):
+        _executor = create_executor()
+    return _executor
+
+
+# 使用进程池时 `func` 与其参数都需要能被 pickle
+# 渲染中记录的各阶段耗时会随结果一起带回来，再记到主进程的统计里
+async def run_render(func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+    executor = get_executor()
+    async with render_limiter.slot():
+        if executor is None:
+            return func(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        result, timings = await loop.run_in_executor(
+            executor,
+            partial(collect_timings, func, *args, **kwargs),
+        )
+    record_many(timings)
+    return result
+
+
+@get_driver().on_shutdown
+async def _():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
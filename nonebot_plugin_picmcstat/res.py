@@ -1,3 +1,4 @@
+from functools import cache
 from pathlib import Path
 
 from pil_utils import BuildImage
@@ -9,6 +10,25 @@ GRASS_RES_PATH = RES_DIR / "grass_side_carried.png"
 DIRT_RES_PATH = RES_DIR / "dirt.png"
 DEFAULT_ICON_PATH = RES_DIR / "default.png"
 
-GRASS_RES = BuildImage.open(GRASS_RES_PATH)
-DIRT_RES = BuildImage.open(DIRT_RES_PATH)
-DEFAULT_ICON_RES = BuildImage.open(DEFAULT_ICON_PATH)
+
+def load_res(path: Path) -> BuildImage:
+    # PIL 默认延迟解码，多个渲染线程同时第一次使用时会争抢同一个文件句柄
+    img = BuildImage.open(path)
+    img.image.load()
+    return img
+
+
+# 第一次用到时再读取图片
+@cache
+def get_grass_res() -> BuildImage:
+    return load_res(GRASS_RES_PATH)
+
+
+@cache
+def get_dirt_res() -> BuildImage:
+    return load_res(DIRT_RES_PATH)
+
+
+@cache
+def get_default_icon_res() -> BuildImage:
+    return load_res(DEFAULT_ICON_PATH)
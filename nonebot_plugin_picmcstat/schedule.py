@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Hashable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from .config import config
+from .metrics import record
+
+# 当前请求来自哪个群 / 私聊，由 draw() 设置，排队时同一组的请求与其他组轮流处理
+current_group: ContextVar[Hashable] = ContextVar("current_group", default=None)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# 限制同时进行的任务数，超出的任务按组轮流排队，队列总长度有上限
+# 队列满时，如果有别的组排队的任务明显更多，挤掉那个组最晚排队的任务，否则拒绝新任务
+class FairLimiter:
+    def __init__(self, limit: int, queue_size: int) -> None:
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.rejected = 0
+        self._waiting = 0
+        self._queues: OrderedDict[Hashable, deque[asyncio.Future[None]]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def __len__(self) -> int:
+        return self._waiting
+
+    def _remove(self, group: Hashable, fut: asyncio.Future[None]) -> None:
+        if (queue := self._queues.get(group)) is None or fut not in queue:
+            return
+        queue.remove(fut)
+        self._waiting -= 1
+        if not queue:
+            del self._queues[group]
+
+    def _make_room(self, group: Hashable) -> None:
+        if self._waiting < self.queue_size:
+            return
+
+        mine = len(self._queues.get(group, ()))
+        victim = max(self._queues, key=lambda x: len(self._queues[x]), default=None)
+        if victim is None or len(self._queues[victim]) <= mine + 1:
+            self.rejected += 1
+            raise QueueFullError
+
+        fut = self._queues[victim][-1]
+        self._remove(victim, fut)
+        self.rejected += 1
+        fut.set_exception(QueueFullError())
+
+    # 返回是否排过队
+    async def acquire(self, group: Hashable = None) -> bool:
+        if not self.enabled:
+            return False
+        if self.active < self.limit and not self._waiting:
+            self.active += 1
+            return False
+
+        self._make_room(group)
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(group, deque()).append(fut)
+        self._waiting += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # 已经轮到了但调用方被取消，把名额让给下一个
+                self.release()
+            else:
+                self._remove(group, fut)
+            raise
+        return True
+
+    def release(self) -> None:
+        if not self.enabled:
+            return
+        # 名额直接交给下一个组的第一个任务，这个组再排到最后
+        while self._queues:
+            group, queue = next(iter(self._queues.items()))
+            fut = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(group)
+            else:
+                del self._queues[group]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, group: Hashable = None) -> AsyncIterator[None]:
+        if group is None:
+            group = current_group.get()
+        start = time.perf_counter()
+        if await self.acquire(group):
+            record("queue", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+@contextmanager
+def group_context(group: Hashable) -> Iterator[None]:
+    token = current_group.set(group)
+    try:
+        yield
+    finally:
+        current_group.reset(token)
+
+
+probe_limiter = FairLimiter(config.probe_concurrency, config.queue_size)
+render_limiter = FairLimiter(config.render_concurrency, config.queue_size)
@@ -1,31 +1,40 @@
+import asyncio
+import json
 import random
 import re
 import string
-from collections.abc import Iterator, Sequence
-from typing import TYPE_CHECKING, TypeVar, cast
+import time
+from collections.abc import Awaitable, Callable, Iterator, Sequence
+from functools import cache
+from typing import TYPE_CHECKING, Any, TypeAlias, TypeVar, cast
 
 import dns.asyncresolver
+import dns.exception
 import dns.rdatatype as rd
+import dns.resolver
+from mcstatus.motd import Motd
 from mcstatus.motd.components import (
     Formatting,
     MinecraftColor,
     ParsedMotdComponent,
+    TranslationTag,
     WebColor,
 )
 from mcstatus.motd.transformers import PlainTransformer
 from nonebot import logger
 
+from .cache import SingleFlight, SizedLRUCache, TTLCache
 from .config import config
 from .const import (
-    ENUM_CODE_COLOR,
-    ENUM_CODE_COLOR_BEDROCK,
-    ENUM_STROKE_COLOR,
-    ENUM_STROKE_COLOR_BEDROCK,
-    ENUM_STYLE_BBCODE,
+    CODE_COLOR,
+    CODE_COLOR_BEDROCK,
     FORMAT_CODE_REGEX,
     OBFUSCATED_PLACEHOLDER_REGEX,
     STROKE_COLOR,
+    STROKE_COLOR_BEDROCK,
+    STYLE_BBCODE,
 )
+from .metrics import record, register_cache, timer
 
 if TYPE_CHECKING:
     from dns.rdtypes.IN.SRV import SRV as SRVRecordAnswer  # noqa: N811
@@ -33,11 +42,48 @@ if TYPE_CHECKING:
 
 RANDOM_CHAR_TEMPLATE = f"{string.ascii_letters}{string.digits}!§$%&?#"
 WHITESPACE_EXCLUDE_NEWLINE = string.whitespace.replace("\n", "")
-DNS_RESOLVER = dns.asyncresolver.Resolver()
-DNS_RESOLVER.nameservers = [*DNS_RESOLVER.nameservers, "1.1.1.1", "1.0.0.1"]
+MOTD_CACHE_SIZE = 1024
+# 解析失败时缓存的异常
+DNS_NEGATIVE_EXCEPTIONS = (
+    dns.resolver.NXDOMAIN,
+    dns.resolver.NoAnswer,
+    dns.resolver.NoNameservers,
+    dns.exception.Timeout,
+)
+
+DNSCacheKey: TypeAlias = tuple[str, rd.RdataType]
+dns_cache: TTLCache[DNSCacheKey, "dns.resolver.Answer | Exception"] = TTLCache(
+    config.dns_negative_ttl,
+    config.dns_cache_size,
+)
+dns_flight: SingleFlight[DNSCacheKey, dns.resolver.Answer] = SingleFlight()
+register_cache("dns", "DNS 解析", dns_cache)
+# ("motd" / "name", 原始 MOTD / 玩家名, 是否为基岩版) -> 每行的 BBCode
+# 乱码部分还是占位符
+motd_cache: SizedLRUCache[tuple[str, str, bool], tuple[str, ...]] = SizedLRUCache(
+    MOTD_CACHE_SIZE,
+    lambda _: 1,
+)
+register_cache("motd", "MOTD 解析", motd_cache)
 
 T = TypeVar("T")
 
+ENUM_CODE_COLOR = {MinecraftColor(k): v for k, v in CODE_COLOR.items()}
+ENUM_STROKE_COLOR = {MinecraftColor(k): v for k, v in STROKE_COLOR.items()}
+ENUM_CODE_COLOR_BEDROCK = {MinecraftColor(k): v for k, v in CODE_COLOR_BEDROCK.items()}
+ENUM_STROKE_COLOR_BEDROCK = {
+    MinecraftColor(k): v for k, v in STROKE_COLOR_BEDROCK.items()
+}
+ENUM_STYLE_BBCODE = {Formatting(k): v for k, v in STYLE_BBCODE.items()}
+
+
+# 创建时会读取系统的 DNS 配置，第一次用到时再创建
+@cache
+def get_dns_resolver() -> dns.asyncresolver.Resolver:
+    resolver = dns.asyncresolver.Resolver()
+    resolver.nameservers = [*resolver.nameservers, "1.1.1.1", "1.0.0.1"]
+    return resolver
+
 
 def get_latency_color(delay: float) -> str:
     if delay <= 50:
@@ -69,36 +115,98 @@ def format_mod_list(li: list["RawForgeDataMod"] | list[str]) -> list[str]:
     return sorted((x for x in map(mapping_func, li) if x), key=lambda x: x.lower())
 
 
+def normalize_address(ip: str) -> str:
+    host, sep, port = ip.strip().partition(":")
+    host = host.lower().rstrip(".")
+    return f"{host}{sep}{port}" if port else host
+
+
+async def dns_resolve(host: str, rd_type: rd.RdataType) -> dns.resolver.Answer:
+    key = (host.lower().rstrip("."), rd_type)
+    if (cached := dns_cache.get(key)) is not None:
+        if isinstance(cached, Exception):
+            raise cached.with_traceback(None)
+        return cached
+
+    async def resolve() -> dns.resolver.Answer:
+        try:
+            answer = await get_dns_resolver().resolve(host, rd_type)
+        except DNS_NEGATIVE_EXCEPTIONS as e:
+            dns_cache.set(key, e)
+            raise
+        dns_cache.set(key, answer, ttl=answer.expiration - time.time())
+        return answer
+
+    return await dns_flight.do(key, resolve)
+
+
+async def resolve_host_record(host: str, rd_type: rd.RdataType) -> str | None:
+    try:
+        resp = (await dns_resolve(host, rd_type)).response
+        name = resp.answer[0][0].to_text()  # type: ignore
+    except Exception as e:
+        logger.debug(
+            f"Failed to resolve {rd_type.name} record for {host}: "
+            f"{e.__class__.__name__}: {e}",
+        )
+        return None
+    logger.debug(f"Resolved {rd_type.name} record for {host}: {name}")
+    return name
+
+
 async def resolve_host(
     host: str,
     data_types: list[rd.RdataType] | None = None,
 ) -> str | None:
+    # 同时查询所有记录类型，按 data_types 的顺序决定优先使用哪个结果
     data_types = data_types or [rd.CNAME, rd.AAAA, rd.A]
-    for rd_type in data_types:
-        try:
-            resp = (await DNS_RESOLVER.resolve(host, rd_type)).response
-            name = resp.answer[0][0].to_text()  # type: ignore
-        except Exception as e:
-            logger.debug(
-                f"Failed to resolve {rd_type.name} record for {host}: "
-                f"{e.__class__.__name__}: {e}",
-            )
-        else:
-            logger.debug(f"Resolved {rd_type.name} record for {host}: {name}")
+    tasks = [
+        asyncio.create_task(resolve_host_record(host, rd_type))
+        for rd_type in data_types
+    ]
+    try:
+        for rd_type, task in zip(data_types, tasks):
+            if not (name := await task):
+                continue
             if rd_type is rd.CNAME:
                 return await resolve_host(name)
             return name
+    finally:
+        for task in tasks:
+            task.cancel()
     return None
 
 
 async def resolve_srv(host: str) -> tuple[str, int]:
     host = "_minecraft._tcp." + host
-    resp = await DNS_RESOLVER.resolve(host, rd.SRV)
+    resp = await dns_resolve(host, rd.SRV)
     answer = cast("SRVRecordAnswer", resp[0])
     return str(answer.target), int(answer.port)
 
 
-async def resolve_ip(ip: str, srv: bool = False) -> tuple[str, int | None]:
+# 一次查询内共享的解析结果，避免自动检测时 JE 与 BE 重复解析同一个域名
+class ResolveContext:
+    def __init__(self) -> None:
+        self._results: dict[tuple[str, str], asyncio.Future[Any]] = {}
+
+    async def _memo(self, key: tuple[str, str], func: Callable[[], Awaitable[T]]) -> T:
+        if (fut := self._results.get(key)) is None:
+            fut = self._results[key] = asyncio.ensure_future(func())
+        return await asyncio.shield(fut)
+
+    async def resolve_srv(self, host: str) -> tuple[str, int]:
+        return await self._memo(("srv", host), lambda: resolve_srv(host))
+
+    async def resolve_host(self, host: str) -> str | None:
+        return await self._memo(("host", host), lambda: resolve_host(host))
+
+
+async def resolve_ip(
+    ip: str,
+    srv: bool = False,
+    ctx: ResolveContext | None = None,
+) -> tuple[str, int | None]:
+    ctx = ctx or ResolveContext()
     if ":" in ip:
         host, port = ip.split(":", maxsplit=1)
     else:
@@ -106,18 +214,22 @@ async def resolve_ip(ip: str, srv: bool = False) -> tuple[str, int | None]:
         port = None
 
     if (not port) and srv:
+        # 大部分服务器都没有 SRV 记录，查不到也算作正常完成
+        start = time.perf_counter()
         try:
-            host, port = await resolve_srv(host)
+            host, port = await ctx.resolve_srv(host)
         except Exception as e:
             logger.debug(
                 f"Failed to resolve SRV record for {host}: {e.__class__.__name__}: {e}",
             )
+        record("srv", time.perf_counter() - start)
         logger.debug(f"Resolved SRV record for {ip}: {host}:{port}")
 
-    return (
-        (await resolve_host(host) if config.resolve_dns else None) or host,
-        int(port) if port else None,
-    )
+    resolved = None
+    if config.resolve_dns:
+        with timer("host"):
+            resolved = await ctx.resolve_host(host)
+    return resolved or host, int(port) if port else None
 
 
 def chunks(lst: Sequence[T], n: int) -> Iterator[Sequence[T]]:
@@ -238,11 +350,7 @@ class BBCodeTransformer(PlainTransformer):
 
     def _format_output(self, results: list[str]) -> str:
         text = super()._format_output(results) + "".join(reversed(self.on_reset))
-        return re.sub(
-            OBFUSCATED_PLACEHOLDER_REGEX,
-            lambda m: (random_char(len(i)) if (i := m.group("inner")) else ""),
-            text,
-        )
+        return fill_obfuscated(text)
 
     def _handle_minecraft_color(self, element: MinecraftColor, /) -> str:
         stroke_map = ENUM_STROKE_COLOR_BEDROCK if self.bedrock else ENUM_STROKE_COLOR
@@ -262,3 +370,125 @@ class BBCodeTransformer(PlainTransformer):
         start, end = ENUM_STYLE_BBCODE[element]
         self.on_reset.append(end)
         return start
+
+
+# 把乱码（§k）的占位符换成随机字符，每次画图时都要重新生成
+def fill_obfuscated(text: str) -> str:
+    if "[obfuscated]" not in text:
+        return text
+    return re.sub(
+        OBFUSCATED_PLACEHOLDER_REGEX,
+        lambda m: (random_char(len(i)) if (i := m.group("inner")) else ""),
+        text,
+    )
+
+
+# 一次遍历完成 split_motd_lines 与 BBCodeTransformer.transform 的工作，结果与
+# [BBCodeTransformer(bedrock=bedrock).transform(x) for x in split_motd_lines(motd)]
+# 相同，只是乱码部分保留为占位符
+def motd_to_bbcode_lines(
+    motd: Sequence[ParsedMotdComponent],
+    bedrock: bool = False,
+) -> list[str]:
+    stroke_map = ENUM_STROKE_COLOR_BEDROCK if bedrock else ENUM_STROKE_COLOR
+    color_map = ENUM_CODE_COLOR_BEDROCK if bedrock else ENUM_CODE_COLOR
+    lines: list[str] = []
+
+    out: list[str] = []
+    on_reset: list[str] = []
+    # 当前行是否有内容，只有颜色、格式的行也算
+    has_content = False
+    # 换行后要在新的一行重新应用的颜色与格式
+    using_color: MinecraftColor | WebColor | None = None
+    using_formats: list[Formatting] = []
+
+    def reset():
+        out.extend(on_reset)
+        on_reset.clear()
+
+    def handle(comp: ParsedMotdComponent):
+        if isinstance(comp, str):
+            out.append(comp)
+        elif isinstance(comp, MinecraftColor):
+            reset()
+            out.append(f"[stroke={stroke_map[comp]}][color={color_map[comp]}]")
+            on_reset.append("[/color][/stroke]")
+        elif isinstance(comp, WebColor):
+            out.append(f"[stroke={STROKE_COLOR['f']}][color={comp.hex}]")
+            on_reset.append("[/color][/stroke]")
+        elif isinstance(comp, Formatting):
+            if comp is Formatting.RESET:
+                reset()
+            else:
+                start, end = ENUM_STYLE_BBCODE[comp]
+                out.append(start)
+                on_reset.append(end)
+        elif not isinstance(comp, TranslationTag):
+            raise TypeError(f"Unknown MOTD component: {comp!r}")
+
+    for comp in motd:
+        if isinstance(comp, str) and "\n" in comp:
+            *str_lines, last_line = comp.split("\n")
+            for line in str_lines:
+                if line:
+                    out.append(line)
+                reset()
+                lines.append("".join(out))
+                out.clear()
+                has_content = False
+                if using_color:
+                    handle(using_color)
+                    has_content = True
+                for x in using_formats:
+                    handle(x)
+                    has_content = True
+            if last_line:
+                out.append(last_line)
+                has_content = True
+            continue
+
+        if isinstance(comp, MinecraftColor | WebColor):
+            using_color = comp
+        elif isinstance(comp, Formatting):
+            if comp is Formatting.RESET:
+                using_color = None
+                using_formats = []
+            else:
+                using_formats.append(comp)
+        handle(comp)
+        has_content = True
+
+    if has_content:
+        lines.append("".join(out) + "".join(reversed(on_reset)))
+    return lines
+
+
+def get_motd_cache_key(raw: Any) -> str:
+    if isinstance(raw, str):
+        return raw
+    return json.dumps(raw, ensure_ascii=False, sort_keys=True)
+
+
+# MOTD 每行的 BBCode，按原始 MOTD 缓存，乱码部分还是占位符
+def motd_bbcode_placeholders(motd: Motd) -> tuple[str, ...]:
+    key = ("motd", get_motd_cache_key(motd.raw), motd.bedrock)
+    if (lines := motd_cache.get(key)) is None:
+        start = time.perf_counter()
+        lines = tuple(motd_to_bbcode_lines(trim_motd(motd.parsed), motd.bedrock))
+        motd_cache.stats.miss_time += time.perf_counter() - start
+        motd_cache.set(key, lines)
+    return lines
+
+
+# 乱码部分在返回前才换成随机字符
+def motd_bbcode_lines(motd: Motd) -> list[str]:
+    return [fill_obfuscated(x) for x in motd_bbcode_placeholders(motd)]
+
+
+# 玩家名等单行文字中的格式代码转为 BBCode
+def name_to_bbcode(name: str, bedrock: bool = False) -> str:
+    key = ("name", name, bedrock)
+    if (lines := motd_cache.get(key)) is None:
+        lines = ("".join(motd_to_bbcode_lines(Motd.parse(name).parsed, bedrock)),)
+        motd_cache.set(key, lines)
+    return fill_obfuscated(lines[0])